@@ -0,0 +1,106 @@
+# Compact on-disk format for the list, omdb and tmdb caches and the dbpedia store.
+# Version 1 is minified json wrapped in a small header, with the dbpedia
+# resource prefix stripped from every string that starts with it, optionally
+# gzipped.  Readers sniff the gzip magic and the header, so legacy
+# indent=2 json files still load and are rewritten compactly on next write.
+#
+#   python cache_format.py convert [--gzip] <file or directory> [...]
+
+import gzip
+import json
+import os
+import sys
+
+import file_util
+
+FORMAT_VERSION = 1
+FORMAT_KEY = "_cache_format"
+RESOURCE_PREFIX = "http://dbpedia.org/resource/"
+# Gzip the files we write.  Minified json alone is already several times
+# smaller than the legacy files and parses faster; gzip trades a little
+# read time for much less disk.
+COMPRESS = os.environ.get("CACHE_COMPRESS", "") == "1"
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_HEADER = '{"%s":' % FORMAT_KEY
+# The prefix is stripped from the serialized text rather than the values, so
+# reading stays a str.replace plus json.loads, both in C.  A string opening
+# with "~ stands for the prefix; strings that really start with ~ are written
+# with the ~ as a \u007e escape, which json.loads turns back into ~.
+_PREFIXED = '"' + RESOURCE_PREFIX
+_MARKED = '"~'
+_ESCAPED = '"\\u007e'
+
+
+def encode(value) -> str:
+    """Serialize value as versioned, minified, prefix-stripped json text."""
+    text = json.dumps({FORMAT_KEY: FORMAT_VERSION, "data": value}, separators=(",", ":"), ensure_ascii=False)
+    return text.replace(_MARKED, _ESCAPED).replace(_PREFIXED, _MARKED)
+
+
+def decode(text: str):
+    """Parse text written by encode(), or legacy plain json."""
+    if not text.startswith(_HEADER):
+        return json.loads(text)
+    value = json.loads(text.replace(_MARKED, _PREFIXED))
+    if value[FORMAT_KEY] > FORMAT_VERSION:
+        raise ValueError(f"cache format version {value[FORMAT_KEY]} is newer than this code understands")
+    return value["data"]
+
+
+def dumps(value, compress: bool = None) -> bytes:
+    """Serialize value for writing to disk."""
+    data = encode(value).encode("utf-8")
+    if COMPRESS if compress is None else compress:
+        data = gzip.compress(data, compresslevel=6)
+    return data
+
+
+def loads(data: bytes):
+    """Parse bytes written by dumps(), gzipped or not, or a legacy json file."""
+    if data[:2] == _GZIP_MAGIC:
+        data = gzip.decompress(data)
+    return decode(data.decode("utf-8"))
+
+
+def read(path: str):
+    with open(path, "rb") as IN:
+        return loads(IN.read())
+
+
+def write(path: str, value, compress: bool = None) -> None:
+    """Write value to path atomically in the current format."""
+    file_util.atomic_write(path, dumps(value, compress))
+
+
+def convert(path: str, compress: bool = None) -> tuple:
+    """Rewrite one cache file in the current format.  Returns (old size, new size) in bytes."""
+    old_size = os.path.getsize(path)
+    write(path, read(path), compress)
+    return old_size, os.path.getsize(path)
+
+
+def _json_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".json"):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    if arguments[:1] != ["convert"] or len(arguments) < 2:
+        print("usage: python cache_format.py convert [--gzip] <file or directory> [...]")
+        sys.exit(1)
+    compress = "--gzip" in arguments
+    paths = [argument for argument in arguments[1:] if argument != "--gzip"]
+    total_old = total_new = 0
+    for path in _json_files(paths):
+        old_size, new_size = convert(path, compress)
+        total_old += old_size
+        total_new += new_size
+        print(f"{path}: {old_size} -> {new_size} bytes")
+    print(f"Total: {total_old} -> {total_new} bytes")
@@ -0,0 +1,210 @@
+# Materialized cast-frequency counts for a complete movie list.
+# How many of the list's films each person directed, wrote or acted in, by
+# role and in total, with the total ranking kept sorted.  Once attach()ed
+# to a MovieListComplete, the counts follow the list as films are added,
+# removed or ignored, touching only that film's cast.  attach() keeps them for
+# the process, so a page rerun renders from the kept ranking.  They are saved
+# next to the list along with the cast each film was counted with, so a new
+# process loads one small file instead of every film's metadata, and removing
+# a film takes back exactly what adding it counted.  Changes made elsewhere (another
+# session, the journal) are caught on the next sync by diffing the counted
+# films against the list, and casts edited through
+# dbpedia_movie_util.update_movie_data by recounting the films edited since.
+
+import heapq
+import os
+import threading
+import time
+
+import cache_format
+from symbol_table import symbols
+from unique_movie_list import ROLE_KEYS, ROLES
+
+
+def _intern_casts(casts: dict) -> dict:
+    """{uri: [directors, writers, actors]} of uris as {uri: (ids, ids, ids)}, interned in one batch."""
+    people = list()
+    for cast in casts.values():
+        for role_people in cast:
+            people.extend(role_people)
+    ids = symbols.intern_many(people)
+    interned = dict()
+    start = 0
+    for uri, cast in casts.items():
+        role_ids = list()
+        for role_people in cast:
+            role_ids.append(ids[start:start + len(role_people)])
+            start += len(role_people)
+        interned[uri] = tuple(role_ids)
+    return interned
+
+
+class CastCounts:
+    """Per-role and total film counts for each person in a list, keyed by interned ids."""
+
+    def __init__(self, path: str, movie_data, edited_since=None):
+        # Shared by every session once attached; see attach
+        self.lock = threading.Lock()
+        self.path = path
+        # Callable taking uris and returning {uri: movie struct}, like
+        # dbpedia_movie_util.get_movie_data_many; only called for films whose
+        # counts change
+        self.movie_data = movie_data
+        # Optional callable taking a time.time() value and returning the uris
+        # of films edited since, like dbpedia_movie_util.movies_edited_since
+        self.edited_since = edited_since
+        # Film uri -> the (directors, writers, actors) ids it was counted with
+        self.casts = dict()
+        self.role_counts = tuple(dict() for _ in ROLES)
+        self.totals = dict()
+        # Total ranking, (person id, count) from most films down; None when stale
+        self.ranking = None
+        # When sync last looked for edited films
+        self.synced_at = None
+        self.changed = False
+
+    @classmethod
+    def load(cls, path: str, movie_data, edited_since=None):
+        counts = cls(path, movie_data, edited_since)
+        if os.path.exists(path):
+            saved = cache_format.read(path)
+            if "casts" not in saved:
+                # Written before the casts were kept; counted again from scratch
+                return counts
+            for uri, cast in _intern_casts(saved["casts"]).items():
+                counts._count(uri, cast)
+            counts.ranking = list(zip(symbols.intern_many(uri for uri, _ in saved["ranking"]),
+                                      (count for _, count in saved["ranking"])))
+            counts.synced_at = saved["synced_at"]
+            counts.changed = False
+        return counts
+
+    def save(self) -> None:
+        """Write the counts if they changed since they were loaded or last saved."""
+        with self.lock:
+            if not self.changed:
+                return
+            cache_format.write(self.path, {
+                "casts": {uri: [symbols.uris_for(role_ids) for role_ids in cast] for uri, cast in self.casts.items()},
+                "ranking": [[symbols.uri(person), count] for person, count in self._ranking()],
+                "synced_at": self.synced_at,
+            })
+            self.changed = False
+
+    def _count(self, uri: str, cast: tuple) -> None:
+        self.casts[uri] = cast
+        self._step(cast, 1)
+
+    def _uncount(self, uri: str) -> None:
+        # Takes back exactly the cast that was counted, whatever the film's metadata says now
+        cast = self.casts.pop(uri, None)
+        if cast is not None:
+            self._step(cast, -1)
+
+    def _step(self, cast: tuple, step: int) -> None:
+        for role_counts, role_ids in zip(self.role_counts, cast):
+            for person in role_ids:
+                count = role_counts.get(person, 0) + step
+                total = self.totals.get(person, 0) + step
+                if count > 0:
+                    role_counts[person] = count
+                else:
+                    role_counts.pop(person, None)
+                if total > 0:
+                    self.totals[person] = total
+                else:
+                    self.totals.pop(person, None)
+        self.ranking = None
+        self.changed = True
+
+    @staticmethod
+    def _cast_of(movie: dict) -> tuple:
+        return tuple(symbols.intern_many(movie.get(key) or ()) for key in ROLE_KEYS)
+
+    def update(self, uri: str, present: bool) -> None:
+        """Count or uncount one film after the list changed.  O(cast size)."""
+        with self.lock:
+            if not present:
+                self._uncount(uri)
+                return
+            if uri in self.casts:
+                return
+            movie = self.movie_data([uri]).get(uri)
+            if movie is None:
+                # Left for the next sync to retry
+                return
+            self._count(uri, self._cast_of(movie))
+
+    def sync(self, movies) -> None:
+        """Bring the counts in line with the films in movies, fetching metadata only for films
+        not counted yet and films edited since the last sync."""
+        with self.lock:
+            started = time.time()
+            for uri in self.casts.keys() - movies.keys():
+                self._uncount(uri)
+            if self.edited_since is not None and self.synced_at is not None:
+                for uri in self.edited_since(self.synced_at):
+                    # Counted again below, from the edited metadata
+                    self._uncount(uri)
+            if self.synced_at is None:
+                self.changed = True
+            self.synced_at = started
+            to_add = movies.keys() - self.casts.keys()
+            if not to_add:
+                return
+            found = self.movie_data({uri: movies.get(uri, uri.split("/")[-1]) for uri in to_add})
+            for uri in to_add:
+                if uri in found:
+                    self._count(uri, self._cast_of(found[uri]))
+
+    def _ranking(self) -> list:
+        if self.ranking is None:
+            # Ties in uri order, so the ranking is the same from run to run
+            self.ranking = sorted(self.totals.items(), key=lambda item: (-item[1], symbols.uri(item[0])))
+        return self.ranking
+
+    def top(self, k: int = None, role: str = None) -> list:
+        """[(person uri, film count), ...] from most films down; the k highest if k is given.
+
+        role is one of unique_movie_list.ROLES for that role's count alone,
+        or None for the count over all roles.
+        """
+        with self.lock:
+            if role is None:
+                ranking = self._ranking()
+                ranking = ranking if k is None else ranking[:k]
+            else:
+                items = self.role_counts[ROLES.index(role)].items()
+                key = lambda item: (-item[1], symbols.uri(item[0]))
+                ranking = sorted(items, key=key) if k is None else heapq.nsmallest(k, items, key=key)
+            return [(symbols.uri(person), count) for person, count in ranking]
+
+    def count(self, uri: str, role: str = None) -> int:
+        with self.lock:
+            person = symbols.get(uri)
+            if role is None:
+                return self.totals.get(person, 0)
+            return self.role_counts[ROLES.index(role)].get(person, 0)
+
+
+# Counts file path -> its CastCounts, loaded once per process
+_attached = dict()
+_attached_lock = threading.Lock()
+
+
+def attach(complete_list, movie_data, edited_since=None) -> CastCounts:
+    """Return the counts for a MovieListComplete, brought up to date, and have
+    the list keep them current from now on.
+
+    Pages call this on every rerun.  The counts are loaded once and kept
+    here, so a rerun only diffs the list against the counted films.
+    """
+    path = f"{complete_list.cache_file}.cast_counts"
+    with _attached_lock:
+        counts = _attached.get(path)
+        if counts is None:
+            counts = _attached[path] = CastCounts.load(path, movie_data, edited_since)
+    counts.sync(complete_list.movies)
+    counts.save()
+    complete_list.cast_counts = counts
+    return counts
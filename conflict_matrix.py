@@ -0,0 +1,157 @@
+# Film x person incidence matrix over the complete list, for "Pick from list".
+# Each film's people are a row of a sparse (CSR) matrix whose columns are
+# (role, person) pairs, plus the transposed (CSC) view from each column to
+# its films.  The unique list marks columns used, and a per-film count of
+# used columns answers "which candidates can be added" for every film in one
+# array operation.  When the unique list changes only the columns that
+# changed are touched: the films in those columns get their counts bumped.
+
+import threading
+
+import numpy
+
+from symbol_table import symbols
+from unique_movie_list import ROLE_KEYS, ROLES, Movie
+
+
+class ConflictMatrix:
+    """Which complete-list films a unique list blocks, and by whom."""
+
+    def __init__(self, movie_data: dict):
+        self.lock = threading.Lock()
+        self.uris = list(movie_data)
+        self.row_of = {uri: row for row, uri in enumerate(self.uris)}
+        # (role position, person id) -> column
+        self.columns = dict()
+        self.column_keys = list()
+        indices = list()
+        indptr = [0]
+        for uri in self.uris:
+            movie = movie_data[uri]
+            row_columns = set()
+            for position, key in enumerate(ROLE_KEYS):
+                for person in symbols.intern_many(movie.get(key) or ()):
+                    column = self.columns.get((position, person))
+                    if column is None:
+                        column = self.columns[(position, person)] = len(self.column_keys)
+                        self.column_keys.append((position, person))
+                    row_columns.add(column)
+            indices.extend(sorted(row_columns))
+            indptr.append(len(indices))
+        self.indptr = numpy.array(indptr, dtype=numpy.int64)
+        self.indices = numpy.array(indices, dtype=numpy.int32)
+        # Transposed view: the rows in each column
+        rows = numpy.repeat(numpy.arange(len(self.uris), dtype=numpy.int32), numpy.diff(self.indptr))
+        order = numpy.argsort(self.indices, kind="stable")
+        self.column_rows = rows[order]
+        self.column_indptr = numpy.zeros(len(self.column_keys) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(self.indices, minlength=len(self.column_keys)), out=self.column_indptr[1:])
+        # (used column -> id of the unique-list movie using it, per film how
+        # many of its columns the unique list uses).  sync replaces it whole,
+        # so sessions reading while another syncs never see it half done
+        self.state = (dict(), numpy.zeros(len(self.uris), dtype=numpy.int32))
+
+    def _rows_in(self, columns) -> numpy.ndarray:
+        if not columns:
+            return numpy.zeros(0, dtype=numpy.int32)
+        return numpy.concatenate([self.column_rows[self.column_indptr[column]:self.column_indptr[column + 1]]
+                                  for column in columns])
+
+    def sync(self, unique_list) -> None:
+        """Bring the blocked counts up to date with unique_list, touching only the columns that changed."""
+        used = dict()
+        for position, person, film in unique_list.used_people():
+            column = self.columns.get((position, person))
+            if column is not None:
+                used[column] = film
+        with self.lock:
+            old_used, blocked = self.state
+            added = [column for column in used if column not in old_used]
+            removed = [column for column in old_used if column not in used]
+            blocked = blocked.copy()
+            numpy.add.at(blocked, self._rows_in(added), 1)
+            numpy.subtract.at(blocked, self._rows_in(removed), 1)
+            self.state = (used, blocked)
+
+    def addable(self, uris) -> list:
+        """The uris, in order, that no person in the unique list blocks."""
+        rows = numpy.array([self.row_of[uri] for uri in uris], dtype=numpy.int64)
+        if not len(rows):
+            return list()
+        free = self.state[1][rows] == 0
+        return [uri for uri, ok in zip(uris, free.tolist()) if ok]
+
+    def columns_for(self, movie) -> set:
+        """Columns of a Movie's or movie dict's people.  People in no complete-list film have none."""
+        if isinstance(movie, Movie):
+            people = zip(range(len(ROLES)), (movie.director_ids, movie.writer_ids, movie.actor_ids))
+        else:
+            people = ((position, map(symbols.get, movie.get(key) or ())) for position, key in enumerate(ROLE_KEYS))
+        columns = set()
+        for position, person_ids in people:
+            for person in person_ids:
+                column = self.columns.get((position, person))
+                if column is not None:
+                    columns.add(column)
+        return columns
+
+    def row_columns(self, uri: str) -> set:
+        row = self.row_of[uri]
+        return set(self.indices[self.indptr[row]:self.indptr[row + 1]].tolist())
+
+    def films_in(self, columns) -> list:
+        """Uris of the complete-list films with a person in any of the columns."""
+        return [self.uris[row] for row in numpy.unique(self._rows_in(list(columns))).tolist()]
+
+    def blocking_films(self, uri: str) -> set:
+        """Ids of the unique-list movies that block the film."""
+        used, blocked = self.state
+        if not blocked[self.row_of[uri]]:
+            return set()
+        return {used[column] for column in self.row_columns(uri) if column in used}
+
+    def blockers(self, uri: str) -> list:
+        """(role, person uri, movie uri) for each of the film's people already used,
+        like MovieList.cannot_add_complete."""
+        used, blocked = self.state
+        row = self.row_of[uri]
+        reasons = list()
+        if not blocked[row]:
+            return reasons
+        for column in self.indices[self.indptr[row]:self.indptr[row + 1]].tolist():
+            film = used.get(column)
+            if film is not None:
+                position, person = self.column_keys[column]
+                reasons.append((ROLES[position], symbols.uri(person), symbols.uri(film)))
+        return reasons
+
+
+# name -> (fingerprint of the films it was built from, matrix)
+_matrices = dict()
+_matrices_lock = threading.Lock()
+
+
+def _fingerprint(movie_data: dict) -> int:
+    # Covers each film's people as well as which films there are, so a cast
+    # edited through update_movie_data or an override file rebuilds the matrix
+    return hash(tuple((uri, *(tuple(movie.get(key) or ()) for key in ROLE_KEYS))
+                      for uri, movie in movie_data.items()))
+
+
+def get_conflict_matrix(name: str, movie_data: dict) -> ConflictMatrix:
+    """Return the matrix kept for name, rebuilt if the films in movie_data or their people changed.
+
+    Streamlit reruns the page on every click; keeping the matrix here lets
+    each rerun sync just what changed in the unique list.  A rebuild happens
+    outside the lock and is swapped in once complete, so other sessions keep
+    using the previous matrix meanwhile.
+    """
+    fingerprint = _fingerprint(movie_data)
+    with _matrices_lock:
+        kept = _matrices.get(name)
+    if kept is not None and kept[0] == fingerprint:
+        return kept[1]
+    matrix = ConflictMatrix(movie_data)
+    with _matrices_lock:
+        _matrices[name] = (fingerprint, matrix)
+    return matrix
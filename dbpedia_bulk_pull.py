@@ -0,0 +1,219 @@
+# Bulk pull of every dbpedia film with a title and a gross, for most_popular_movies.
+# Pages are fetched concurrently in a stable ORDER BY ?movie order and
+# appended to a JSONL checkpoint as they finish: one line per film, then a
+# marker line for the page.  An interrupted pull picks up where it stopped,
+# refetching only the pages that have no marker yet.
+#
+#   python dbpedia_bulk_pull.py [--page-size N] [--workers N]
+#
+# or start it from the page, where it runs as a background job.
+
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import http_util
+
+BULK_PULL_FILE = "dbpedia_movies.jsonl"
+PAGE_SIZE = 2000
+WORKERS = 4
+
+_QUERY = """
+PREFIX dbo: <http://dbpedia.org/ontology/>
+PREFIX dbp: <http://dbpedia.org/property/>
+SELECT ?movie ?title ?gross
+WHERE {{
+    {{ SELECT ?movie ?title ?gross
+       WHERE {{
+           ?movie a dbo:Film ;
+               dbp:gross ?gross ;
+               dbp:name ?title .
+       }}
+       ORDER BY ?movie }}
+}}
+LIMIT {limit}
+OFFSET {offset}
+"""
+# The ordered sub-select keeps paging stable and lets Virtuoso page past
+# its sorted-row limit at large offsets.
+
+
+def read_checkpoint(path: str = BULK_PULL_FILE) -> tuple:
+    """Read a checkpoint.  Returns (films, pages) where films is a list of
+    {"movie", "title", "gross"} records, one per film uri, and pages maps each
+    finished page's offset to {"page_size", "rows"}.
+    """
+    films = list()
+    seen = set()
+    pages = dict()
+    if not os.path.exists(path):
+        return films, pages
+    with open(path) as IN:
+        for line in IN:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash; its page has no marker, so it gets refetched
+                continue
+            if "page" in record:
+                pages[record["page"]] = record
+            elif record["movie"] not in seen:
+                seen.add(record["movie"])
+                films.append(record)
+    return films, pages
+
+
+def load_movies(path: str = BULK_PULL_FILE) -> list:
+    """Return every film pulled so far as {"movie", "title", "gross"} records."""
+    return read_checkpoint(path)[0]
+
+
+def _fetch_page(offset: int, page_size: int):
+    """Return the page's rows as records, or None if the query failed."""
+    query = _QUERY.format(limit=page_size, offset=offset)
+    response = http_util.post("https://dbpedia.org/sparql", data={"query": query, "format": "json"})
+    if response is None or response.status_code != 200:
+        return None
+    return [{"movie": row["movie"]["value"], "title": row["title"]["value"], "gross": row["gross"]["value"]}
+            for row in response.json()["results"]["bindings"]]
+
+
+class BulkPull:
+    """One resumable pull into a checkpoint file."""
+
+    def __init__(self, path: str = BULK_PULL_FILE, page_size: int = PAGE_SIZE, workers: int = WORKERS):
+        self.path = path
+        self.page_size = page_size
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+        self.seen = set()
+        self.finished = set()
+        self.films = 0
+        self.next_offset = 0
+        self.end_offset = None
+        self.error = None
+
+    def _resume(self) -> None:
+        """Load the films and finished pages from the checkpoint."""
+        films, pages = read_checkpoint(self.path)
+        with self.lock:
+            self.seen = {film["movie"] for film in films}
+            self.films = len(films)
+            self.finished = set()
+            self.end_offset = None
+            for offset, page in pages.items():
+                # Pages from a run with another page size don't line up with ours
+                if page["page_size"] == self.page_size:
+                    self._finish_page(offset, page["rows"])
+
+    def _finish_page(self, offset: int, rows: int) -> None:
+        self.finished.add(offset)
+        if rows < self.page_size and (self.end_offset is None or offset < self.end_offset):
+            self.end_offset = offset
+
+    def _claim_offset(self):
+        with self.lock:
+            while True:
+                offset = self.next_offset
+                if self.stopped.is_set() or (self.end_offset is not None and offset > self.end_offset):
+                    return None
+                self.next_offset += self.page_size
+                if offset not in self.finished:
+                    return offset
+
+    def _append(self, offset: int, rows: list) -> None:
+        """Append a finished page: its new films, then its marker, then fsync."""
+        with self.lock:
+            lines = list()
+            for row in rows:
+                if row["movie"] not in self.seen:
+                    self.seen.add(row["movie"])
+                    lines.append(json.dumps(row, separators=(",", ":")) + "\n")
+            lines.append(json.dumps({"page": offset, "page_size": self.page_size, "rows": len(rows)}) + "\n")
+            with open(self.path, "a") as OUT:
+                OUT.write("".join(lines))
+                OUT.flush()
+                os.fsync(OUT.fileno())
+            self.films += len(lines) - 1
+            self._finish_page(offset, len(rows))
+
+    def _work(self) -> None:
+        with http_util.background():
+            while True:
+                offset = self._claim_offset()
+                if offset is None:
+                    return
+                rows = _fetch_page(offset, self.page_size)
+                if rows is None:
+                    with self.lock:
+                        self.error = f"DBpedia query failed at offset {offset}"
+                    self.stopped.set()
+                    return
+                self._append(offset, rows)
+
+    def run(self) -> bool:
+        """Pull every remaining page.  Returns True once the checkpoint is complete."""
+        self._resume()
+        self.stopped.clear()
+        self.error = None
+        self.next_offset = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for _ in range(self.workers):
+                executor.submit(self._work)
+        if self.error:
+            print(self.error)
+        return self.is_complete()
+
+    def start(self) -> None:
+        """Run the pull on a background thread, unless it is already running."""
+        with self.lock:
+            if self.is_running():
+                return
+            self.thread = threading.Thread(target=self.run, name="dbpedia-bulk-pull", daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None:
+        """Stop after the pages in flight; the checkpoint keeps everything pulled so far."""
+        self.stopped.set()
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def is_complete(self) -> bool:
+        with self.lock:
+            if self.end_offset is None:
+                return False
+            return all(offset in self.finished for offset in range(0, self.end_offset + 1, self.page_size))
+
+    def progress(self) -> dict:
+        with self.lock:
+            return {"films": self.films, "pages_done": len(self.finished), "error": self.error}
+
+
+_pull = None
+_pull_lock = threading.Lock()
+
+
+def get_bulk_pull() -> BulkPull:
+    """Return the process-wide pull shared by every streamlit session."""
+    global _pull
+    with _pull_lock:
+        if _pull is None:
+            _pull = BulkPull()
+        return _pull
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pull every dbpedia film with a gross into a JSONL checkpoint.")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--output", default=BULK_PULL_FILE)
+    args = parser.parse_args()
+    pull = BulkPull(args.output, args.page_size, args.workers)
+    complete = pull.run()
+    progress = pull.progress()
+    print(f"{progress['films']} films in {args.output} ({'complete' if complete else 'incomplete, run again to resume'})")
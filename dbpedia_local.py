@@ -0,0 +1,291 @@
+# Offline dbpedia backend.
+# Ingests the film subset of a local DBpedia dump into an indexed sqlite file
+# and answers the same lookups dbpedia_movie_util makes against the public
+# sparql endpoint, in the same shapes.
+#
+#   python dbpedia_local.py ingest instance_types_en.ttl.bz2 mappingbased_objects_en.ttl.bz2 ...
+#
+# then run with DBPEDIA_BACKEND=local to serve everything from the local file.
+
+import bz2
+import gzip
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+
+LOCAL_STORE_FILE = os.environ.get("DBPEDIA_LOCAL_STORE", "dbpedia_cache/dbpedia_local.sqlite3")
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+DBO_FILM = "http://dbpedia.org/ontology/Film"
+DBO_THUMBNAIL = "http://dbpedia.org/ontology/thumbnail"
+DBP_RELEASED = "http://dbpedia.org/property/released"
+DBP_GROSS = "http://dbpedia.org/property/gross"
+CREDIT_PREDICATES = {
+    "http://dbpedia.org/ontology/starring": "actor",
+    "http://dbpedia.org/ontology/director": "director",
+    "http://dbpedia.org/ontology/writer": "writer",
+}
+ROLES = ("actor", "director", "writer")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS films (
+    uri TEXT PRIMARY KEY,
+    label TEXT,
+    released TEXT,
+    gross TEXT
+);
+CREATE TABLE IF NOT EXISTS credits (
+    movie_uri TEXT NOT NULL,
+    role TEXT NOT NULL,
+    person_uri TEXT NOT NULL,
+    PRIMARY KEY (movie_uri, role, person_uri)
+);
+CREATE INDEX IF NOT EXISTS credits_by_person ON credits (person_uri, role);
+CREATE TABLE IF NOT EXISTS people (
+    uri TEXT PRIMARY KEY,
+    label TEXT,
+    thumbnail TEXT
+);
+"""
+
+# One N-Triples statement per line: subject, predicate, then either an iri or
+# a literal with an optional language tag or datatype.  DBpedia's .ttl dumps
+# are written the same way, one triple per line.
+_TRIPLE = re.compile(r'^<([^>]*)>\s+<([^>]*)>\s+(?:<([^>]*)>|"((?:[^"\\]|\\.)*)"(?:@([A-Za-z-]+)|\^\^<[^>]*>)?)\s*\.\s*$')
+_LONG_ESCAPE = re.compile(r"\\U([0-9A-Fa-f]{8})")
+
+_local = threading.local()
+
+
+def connect(store_file: str = LOCAL_STORE_FILE) -> sqlite3.Connection:
+    """Return this thread's connection to the local dbpedia store.
+
+    Raises FileNotFoundError if the store hasn't been built.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = dict()
+    connection = connections.get(store_file)
+    if connection is None:
+        if not os.path.exists(store_file):
+            raise FileNotFoundError(f"No local dbpedia store at {store_file}; "
+                                    f"build it with `python dbpedia_local.py ingest <dump files>`")
+        connection = connections[store_file] = sqlite3.connect(store_file, timeout=30)
+    return connection
+
+
+def is_available(store_file: str = LOCAL_STORE_FILE) -> bool:
+    return os.path.exists(store_file)
+
+
+# Ingest
+
+def _open_dump(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8", errors="replace")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+def _unescape(literal):
+    literal = _LONG_ESCAPE.sub(lambda match: chr(int(match.group(1), 16)), literal)
+    try:
+        return json.loads(f'"{literal}"')
+    except ValueError:
+        return literal
+
+
+def iter_triples(paths):
+    """Yield (subject, predicate, object, language) from the dump files.
+
+    object is an iri or the unescaped literal; language is None for iris and
+    untagged literals.  Lines that aren't a single triple are skipped.
+    """
+    for path in paths:
+        with _open_dump(path) as IN:
+            for line in IN:
+                if not line.startswith("<"):
+                    continue
+                match = _TRIPLE.match(line)
+                if not match:
+                    continue
+                subject, predicate, iri, literal, language = match.groups()
+                if iri is not None:
+                    yield subject, predicate, iri, None
+                else:
+                    yield subject, predicate, _unescape(literal), language
+
+
+def ingest(paths, store_file: str = LOCAL_STORE_FILE, batch_size: int = 50000) -> dict:
+    """Build the local store from DBpedia dump files.
+
+    Makes three streaming passes: the first finds the films, the second
+    their credits, release dates and grosses, and the third english labels
+    and thumbnails for those films and the people credited on them.  Only
+    facts about films are kept.  The store is built alongside the old one
+    and only replaces it once complete.
+    """
+    building_file = store_file + ".building"
+    os.makedirs(os.path.dirname(store_file) or ".", exist_ok=True)
+    if os.path.exists(building_file):
+        os.remove(building_file)
+    connection = sqlite3.connect(building_file)
+    try:
+        counts = _build(connection, paths, batch_size)
+    except BaseException:
+        connection.close()
+        os.remove(building_file)
+        raise
+    connection.close()
+    os.replace(building_file, store_file)
+    print(f"Ingested {counts['films']} films and {counts['people']} people into {store_file}")
+    return counts
+
+
+def _build(connection: sqlite3.Connection, paths, batch_size: int) -> dict:
+    connection.executescript(_SCHEMA)
+    print("Pass 1: films")
+    films = set()
+    for subject, predicate, value, _ in iter_triples(paths):
+        if predicate == RDF_TYPE and value == DBO_FILM:
+            films.add(subject)
+    with connection:
+        connection.executemany("INSERT INTO films (uri) VALUES (?)", ((uri,) for uri in films))
+
+    print("Pass 2: credits, release dates and grosses")
+    credits = list()
+    released = list()
+    grosses = list()
+
+    def flush():
+        with connection:
+            connection.executemany("INSERT OR IGNORE INTO credits (movie_uri, role, person_uri) VALUES (?, ?, ?)",
+                                   credits)
+            # The first value in the dump wins, as with one pass over it
+            connection.executemany("UPDATE films SET released = ? WHERE uri = ? AND released IS NULL", released)
+            connection.executemany("UPDATE films SET gross = ? WHERE uri = ? AND gross IS NULL", grosses)
+        del credits[:], released[:], grosses[:]
+
+    for subject, predicate, value, _ in iter_triples(paths):
+        if subject not in films:
+            continue
+        if predicate in CREDIT_PREDICATES:
+            credits.append((subject, CREDIT_PREDICATES[predicate], value))
+        elif predicate == DBP_RELEASED:
+            released.append((value, subject))
+        elif predicate == DBP_GROSS:
+            grosses.append((value, subject))
+        if len(credits) + len(released) + len(grosses) >= batch_size:
+            flush()
+    flush()
+    people = {person_uri for (person_uri,) in connection.execute("SELECT DISTINCT person_uri FROM credits")}
+
+    print("Pass 3: labels and thumbnails")
+    film_labels = list()
+    person_rows = dict()
+    for subject, predicate, value, language in iter_triples(paths):
+        if predicate == RDFS_LABEL and language == "en":
+            if subject in films:
+                film_labels.append((value, subject))
+            if subject in people:
+                person_rows.setdefault(subject, [None, None])[0] = value
+        elif predicate == DBO_THUMBNAIL and subject in people:
+            person_rows.setdefault(subject, [None, None])[1] = value
+        if len(film_labels) >= batch_size:
+            with connection:
+                connection.executemany("UPDATE films SET label = ? WHERE uri = ?", film_labels)
+            film_labels = list()
+    with connection:
+        connection.executemany("UPDATE films SET label = ? WHERE uri = ?", film_labels)
+        connection.executemany("INSERT INTO people (uri, label, thumbnail) VALUES (?, ?, ?)",
+                               ((uri, *person_rows.get(uri, (None, None))) for uri in people))
+    return {"films": len(films), "people": len(people)}
+
+
+# Lookups, in the shapes dbpedia_movie_util returns
+
+def search_for_movies_by_title(title):
+    """Return (movie uri, title) tuples for films whose label contains the given text."""
+    query = "SELECT uri, label FROM films WHERE label LIKE ? ESCAPE '\\'"
+    pattern = "%" + title.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return [(uri, label) for uri, label in connect().execute(query, (pattern,))]
+
+
+def fetch_movie_data(movie_titles):
+    """Return movie structs for a dict of movie uri -> title."""
+    connection = connect()
+    results = dict()
+    for movie_uri, movie_title in movie_titles.items():
+        row = connection.execute("SELECT released, gross FROM films WHERE uri = ?", (movie_uri,)).fetchone()
+        released, gross = row if row else (None, None)
+        movie_struct = {"uri": movie_uri, "title": movie_title,
+                        "directors": list(), "writers": list(), "actors": list()}
+        query = "SELECT role, person_uri FROM credits WHERE movie_uri = ? ORDER BY rowid"
+        for role, person_uri in connection.execute(query, (movie_uri,)):
+            movie_struct[role + "s"].append(person_uri)
+        movie_struct["release_date"] = released or "Unknown"
+        movie_struct["gross_revenue"] = gross or "Unknown"
+        results[movie_uri] = movie_struct
+    return results
+
+
+def get_person_thumbnail(person_uri):
+    row = connect().execute("SELECT thumbnail FROM people WHERE uri = ?", (person_uri,)).fetchone()
+    return row[0] if row else None
+
+
+def _person_label(connection, person_uri):
+    row = connection.execute("SELECT label FROM people WHERE uri = ?", (person_uri,)).fetchone()
+    return row[0] if row else None
+
+
+def get_person_labels(person_uris):
+    """Return uri -> label for the given people that have one."""
+    connection = connect()
+    labels = dict()
+    for person_uri in person_uris:
+        label = _person_label(connection, person_uri)
+        if label:
+            labels[person_uri] = label
+    return labels
+
+
+def find_person_by_uri(dbpedia_uri, role):
+    """Return {"uri", "label", "movies"} for the person's movies in the given role."""
+    connection = connect()
+    query = "SELECT movie_uri FROM credits WHERE person_uri = ? AND role = ? ORDER BY rowid"
+    movies = [movie_uri for (movie_uri,) in connection.execute(query, (dbpedia_uri, role))]
+    return {"uri": dbpedia_uri, "label": _person_label(connection, dbpedia_uri), "movies": movies}
+
+
+def find_person_filmography(dbpedia_uri):
+    """Return the find_movies_by_cast(..., 'all') wrapper for the person."""
+    wrapper = {role: find_person_by_uri(dbpedia_uri, role) for role in ROLES}
+    wrapper["thumbnail"] = get_person_thumbnail(dbpedia_uri)
+    return wrapper
+
+
+def search_for_person(search_term, limit=20):
+    """Stand-in for the wikipedia person search: people whose label contains the text.
+
+    Returns dicts with a wikipedia-style "title" so the pages can build the uri
+    from it the same way.
+    """
+    query = "SELECT uri FROM people WHERE label LIKE ? ESCAPE '\\' LIMIT ?"
+    pattern = "%" + search_term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    results = list()
+    for (uri,) in connect().execute(query, (pattern, limit)):
+        results.append({"title": uri.split("/")[-1].replace("_", " ")})
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "ingest":
+        ingest(sys.argv[2:])
+    else:
+        print("usage: python dbpedia_local.py ingest <dump file> [<dump file> ...]")
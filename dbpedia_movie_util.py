@@ -1,18 +1,92 @@
 # Fetch movie data using dbpedia sparql query
 
-import requests
+import copy
 import json
 import os
+import urllib.parse
 
 import streamlit
 
-dbpedia_cache = "dbpedia_cache"
+import dbpedia_local
+import dbpedia_store
+import http_util
+import memo_util
+import negative_cache
+import singleflight_util
+import title_index
+
+dbpedia_cache = dbpedia_store.DBPEDIA_CACHE_DIR
 os.makedirs(dbpedia_cache, exist_ok=True)
 
+# "remote" queries dbpedia.org; "local" serves everything from the offline
+# store built by `python dbpedia_local.py ingest ...`.
+DBPEDIA_BACKEND = os.environ.get("DBPEDIA_BACKEND", "remote")
+
+def set_backend(backend):
+    """Switch between the "remote" sparql endpoint and the "local" offline store."""
+    global DBPEDIA_BACKEND
+    if backend not in ("remote", "local"):
+        raise ValueError(f"Unknown dbpedia backend {backend}")
+    DBPEDIA_BACKEND = backend
+
+def _use_local():
+    return DBPEDIA_BACKEND == "local"
+
+# Process-wide memo of movie structs and 'all' filmographies, so page reruns
+# don't go back to the store for the same entities every time.  Callers must
+# treat what they get back from the bulk/cast lookups as read-only.
+MOVIE_MEMO_SIZE = 5000
+CAST_MEMO_SIZE = 20000
+_movie_memo = memo_util.LruCache(MOVIE_MEMO_SIZE)
+_cast_memo = memo_util.LruCache(CAST_MEMO_SIZE)
+
+# Concurrent sessions missing the cache for the same entity share one fetch
+_flights = singleflight_util.SingleFlight()
+# Title searches already merged with dbpedia's results, which are in the title index since
+TITLE_SEARCH_MEMO_SIZE = 1000
+_title_search_memo = memo_util.LruCache(TITLE_SEARCH_MEMO_SIZE)
+
+def _check_memo_freshness():
+    """Drop the memos if another process has written to the store."""
+    if dbpedia_store.changed_externally():
+        _movie_memo.clear()
+        _cast_memo.clear()
+
+def memo_stats():
+    """Return hit/miss counters for the movie and cast memos."""
+    return {"movies": _movie_memo.stats(), "cast": _cast_memo.stats()}
+
 def search_for_movies_by_title(title):
-    title = title.lower()
-    """Search for movies by title using a dbpedia sparql query and full text search."""
+    """Search for movies by title, locally first and then with a dbpedia sparql full text search."""
     """Return a list of tuples containing the movie uri and title."""
+    index = title_index.get_title_index()
+    local_movies = index.search(title)
+    search_key = title_index.normalize(title)
+    # Partial and fuzzy local hits may miss films we've never seen, so only an
+    # exact title (or a search already merged with dbpedia's) stays local
+    if index.has_title(title) or _title_search_memo.get(search_key)[0]:
+        return local_movies
+    if negative_cache.check("dbpedia_title_search", search_key):
+        return local_movies
+    movies = _flights.do(("title_search", search_key), _search_for_movies_by_title_remote, title)
+    if movies is None:
+        negative_cache.remember("dbpedia_title_search", search_key, negative_cache.SERVER_ERROR)
+        return local_movies
+    if not movies:
+        negative_cache.remember("dbpedia_title_search", search_key, negative_cache.NOT_FOUND)
+        return local_movies
+    # Remember them so the next search for this (e.g. on rerun) stays local
+    index.add_many(movies)
+    dbpedia_store.put_titles(movies)
+    _title_search_memo.put(search_key, True)
+    merged = index.search(title, limit=len(local_movies) + len(movies))
+    found = {movie_uri for movie_uri, _ in merged}
+    return merged + [movie for movie in movies if movie[0] not in found]
+
+def _search_for_movies_by_title_remote(title):
+    title = title.lower()
+    if _use_local():
+        return dbpedia_local.search_for_movies_by_title(title)
     query = f"""
     PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
     PREFIX dbo: <http://dbpedia.org/ontology/>
@@ -25,8 +99,8 @@ def search_for_movies_by_title(title):
     }}
     """
     url = "http://dbpedia.org/sparql"
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
+    response = http_util.get(url, params={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
         return None
     movie_data = response.json()
     movies = list()
@@ -34,115 +108,44 @@ def search_for_movies_by_title(title):
         movies.append((movie["movie"]["value"], movie["title"]["value"]))
     return movies
 
-def get_movie_data(movie_uri, movie_title, ignore_cache=False):
-    """Get movie data from dbpedia using a sparql query."""
-    print("Looking up movie data for", movie_uri)
-    # Make a filename-safe version of the movie uri
+def _split_concat(binding, name):
+    """Split a GROUP_CONCAT'd list of uris out of a sparql result binding."""
+    if name not in binding:
+        return list()
+    return [value for value in binding[name]["value"].split(" ") if value]
+
+def _movie_cache_name(movie_uri):
+    """Make a filename-safe version of the movie uri."""
     # take off the http://dbpedia.org/resource/ part
     filename_safe_movie_id = movie_uri.replace("http://dbpedia.org/resource/", "")
-    filename_safe_movie_uri = filename_safe_movie_id.replace("/", "_")
-    cache_file = f"{dbpedia_cache}/{filename_safe_movie_uri}.json"
-    if not ignore_cache and os.path.exists(cache_file):
-        # streamlit.write("Fetching movie data from cache")
-        with open(cache_file) as IN:
-            structure = json.load(IN)
-            # Check that structure contains all of the required keys: directors, actors, writers, release_date and gross_revenue
-            if "directors" in structure and "actors" in structure and "writers" in structure:
-                if "release_date" in structure and "gross_revenue" in structure:
-                    return structure
-            # Otherwise continue to fetch the data from dbpedia
-    # streamlit.write("Fetching movie data from dbpedia")
-    movie_struct = dict()
-    movie_struct["uri"] = movie_uri
-    movie_struct["title"] = movie_title
-    url = "http://dbpedia.org/sparql"
+    return filename_safe_movie_id.replace("/", "_")
 
-    # This query gets the directors
-    query = f"""
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    PREFIX dbo: <http://dbpedia.org/ontology/>
-    SELECT ?director
-    WHERE {{
-        <{movie_uri}> dbo:director ?director .
-    }}
-    """
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
-        return None
-    director_data = response.json()
-    # streamlit.write("Directors query results")
-    # streamlit.json(json.dumps(director_data, indent=2))
-    directors = list()
-    for director in director_data["results"]["bindings"]:
-        directors.append(director["director"]["value"])
-    movie_struct["directors"] = directors
-
-    # Next query gets the writers
-    query = f"""
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    PREFIX dbo: <http://dbpedia.org/ontology/>
-    SELECT ?writer
-    WHERE {{
-        <{movie_uri}> dbo:writer ?writer .
-    }}
-    """
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
-        return None
-    writer_data = response.json()
-    # streamlit.write("Writers query results")
-    # streamlit.json(json.dumps(writer_data, indent=2))
-    writers = list()
-    for writer in writer_data["results"]["bindings"]:
-        writers.append(writer["writer"]["value"])
-    movie_struct["writers"] = writers
-
-    # Next query gets the actors
-    query = f"""
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    PREFIX dbo: <http://dbpedia.org/ontology/>
-    SELECT ?actor
-    WHERE {{
-        <{movie_uri}> dbo:starring ?actor .
-    }}
-    """
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
-        return None
-    actor_data = response.json()
-    # streamlit.write("Actors query results")
-    # streamlit.json(json.dumps(actor_data, indent=2))
-    actors = list()
-    for actor in actor_data["results"]["bindings"]:
-        actors.append(actor["actor"]["value"])
-    movie_struct["actors"] = actors
-
-    # Next gets the release date and gross revenue
-    query = f"""
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    PREFIX dbo: <http://dbpedia.org/ontology/>
-    PREFIX dbp: <http://dbpedia.org/property/>
-    select ?release_date ?gross
-    where {{
-        <{movie_uri}> dbp:released ?release_date .
-        <{movie_uri}> dbp:gross ?gross .
-    }}
-    """
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
-        return None
-    revenue_data = response.json()
-    # streamlit.write("Revenue query results")
-    # streamlit.json(json.dumps(revenue_data, indent=2))
-    # Safely attempt to set release_date and gross_revenue
-    bindings = revenue_data["results"]["bindings"]
-    if len(bindings) == 0:
-        movie_struct["release_date"] = "Unknown"
-        movie_struct["gross_revenue"] = "Unknown"
-    else:
-        movie_struct["release_date"] = bindings[0]["release_date"]["value"]
-        movie_struct["gross_revenue"] = bindings[0]["gross"]["value"]
+def _is_complete(structure):
+    # Check that structure contains all of the required keys: directors, actors, writers, release_date and gross_revenue
+    if "directors" in structure and "actors" in structure and "writers" in structure:
+        if "release_date" in structure and "gross_revenue" in structure:
+            return True
+    return False
 
+def _read_cached_movie(movie_uri):
+    """Return the cached movie struct, or None if it is missing or incomplete."""
+    found, structure = _movie_memo.get(movie_uri)
+    if found:
+        return structure
+    structure = dbpedia_store.get_movie(movie_uri)
+    if structure and _is_complete(structure):
+        _movie_memo.put(movie_uri, structure)
+        return structure
+    return None
+
+def _store_movies(movie_structs):
+    dbpedia_store.put_movies(movie_structs)
+    for movie_struct in movie_structs:
+        _movie_memo.put(movie_struct["uri"], movie_struct)
+
+def _apply_overrides(movie_struct):
+    """Apply any override file for the movie to the struct."""
+    filename_safe_movie_uri = _movie_cache_name(movie_struct["uri"])
     # Check for an override file in cache
     override_file = f"{dbpedia_cache}/overrides/{filename_safe_movie_uri}.json"
     if os.path.exists(override_file):
@@ -150,21 +153,215 @@ def get_movie_data(movie_uri, movie_title, ignore_cache=False):
             overrides = json.load(IN)
             for key in overrides:
                 movie_struct[key] = overrides[key]
+    return movie_struct
 
-    with open(cache_file, "w") as OUT:
-        OUT.write(json.dumps(movie_struct, indent=2))
+def _fetch_movie_data(movie_titles):
+    """Fetch movie structs for a dict of movie uri -> title in one sparql query.
+
+    Returns a dict of movie uri -> movie struct, or None if the query failed.
+    """
+    if _use_local():
+        return dbpedia_local.fetch_movie_data(movie_titles)
+    values = " ".join(f"<{movie_uri}>" for movie_uri in movie_titles)
+    # Each field gets its own sub-select so the OPTIONAL blocks don't multiply
+    # against each other, and a missing field (e.g. no dbp:gross) doesn't
+    # blank out the others.
+    query = f"""
+    PREFIX dbo: <http://dbpedia.org/ontology/>
+    PREFIX dbp: <http://dbpedia.org/property/>
+    SELECT ?movie ?directors ?writers ?actors ?release_date ?gross
+    WHERE {{
+        {{ SELECT ?movie (GROUP_CONCAT(DISTINCT ?director; separator=" ") AS ?directors)
+           WHERE {{ VALUES ?movie {{ {values} }} OPTIONAL {{ ?movie dbo:director ?director . }} }}
+           GROUP BY ?movie }}
+        {{ SELECT ?movie (GROUP_CONCAT(DISTINCT ?writer; separator=" ") AS ?writers)
+           WHERE {{ VALUES ?movie {{ {values} }} OPTIONAL {{ ?movie dbo:writer ?writer . }} }}
+           GROUP BY ?movie }}
+        {{ SELECT ?movie (GROUP_CONCAT(DISTINCT ?actor; separator=" ") AS ?actors)
+           WHERE {{ VALUES ?movie {{ {values} }} OPTIONAL {{ ?movie dbo:starring ?actor . }} }}
+           GROUP BY ?movie }}
+        {{ SELECT ?movie (SAMPLE(?released) AS ?release_date)
+           WHERE {{ VALUES ?movie {{ {values} }} OPTIONAL {{ ?movie dbp:released ?released . }} }}
+           GROUP BY ?movie }}
+        {{ SELECT ?movie (SAMPLE(?gross_value) AS ?gross)
+           WHERE {{ VALUES ?movie {{ {values} }} OPTIONAL {{ ?movie dbp:gross ?gross_value . }} }}
+           GROUP BY ?movie }}
+    }}
+    """
+    url = "http://dbpedia.org/sparql"
+    # POST, since a chunk of uris repeated per sub-select is too long for a url
+    response = http_util.post(url, data={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
+        return None
+    results = dict()
+    for row in response.json()["results"]["bindings"]:
+        movie_uri = row["movie"]["value"]
+        movie_struct = dict()
+        movie_struct["uri"] = movie_uri
+        movie_struct["title"] = movie_titles[movie_uri]
+        movie_struct["directors"] = _split_concat(row, "directors")
+        movie_struct["writers"] = _split_concat(row, "writers")
+        movie_struct["actors"] = _split_concat(row, "actors")
+        movie_struct["release_date"] = row.get("release_date", {}).get("value", "Unknown")
+        movie_struct["gross_revenue"] = row.get("gross", {}).get("value", "Unknown")
+        results[movie_uri] = movie_struct
+    return results
+
+def _empty_movie_struct(movie_uri, movie_title):
+    return {"uri": movie_uri, "title": movie_title, "directors": [], "writers": [], "actors": [],
+            "release_date": "Unknown", "gross_revenue": "Unknown"}
+
+def _is_empty_movie(movie_struct):
+    """True if dbpedia knew nothing at all about the movie."""
+    if movie_struct["directors"] or movie_struct["writers"] or movie_struct["actors"]:
+        return False
+    return movie_struct["release_date"] == "Unknown" and movie_struct["gross_revenue"] == "Unknown"
+
+def _negative_movie_result(movie_uri, movie_title, reason):
+    """What to hand back for a movie remembered as a miss: nothing on an error, an empty struct if not found."""
+    if reason == negative_cache.NOT_FOUND:
+        return _empty_movie_struct(movie_uri, movie_title)
+    return None
+
+def get_movie_data(movie_uri, movie_title, ignore_cache=False):
+    """Get movie data from dbpedia using a sparql query."""
+    print("Looking up movie data for", movie_uri)
+    if not ignore_cache:
+        _check_memo_freshness()
+        structure = _read_cached_movie(movie_uri)
+        if structure:
+            # Hand out a copy; the movie editor mutates what it gets back
+            return copy.deepcopy(structure)
+        reason = negative_cache.check("dbpedia_movie", movie_uri)
+        if reason:
+            return _negative_movie_result(movie_uri, movie_title, reason)
+        # Otherwise continue to fetch the data from dbpedia
+    movie_struct = _flights.do(("movie", movie_uri), _load_movie_data, movie_uri, movie_title, ignore_cache)
+    return copy.deepcopy(movie_struct)
+
+def _load_movie_data(movie_uri, movie_title, ignore_cache):
+    """Fetch and cache one movie.  Runs once per movie however many sessions ask at once."""
+    if not ignore_cache:
+        # Another session may have finished fetching it while we were checking
+        structure = _read_cached_movie(movie_uri)
+        if structure:
+            return structure
+    fetched = _fetch_movie_data({movie_uri: movie_title})
+    if fetched is None:
+        negative_cache.remember("dbpedia_movie", movie_uri, negative_cache.SERVER_ERROR)
+        return None
+    movie_struct = _apply_overrides(fetched.get(movie_uri) or _empty_movie_struct(movie_uri, movie_title))
+    if _is_empty_movie(movie_struct):
+        # Don't cache an empty struct for good; check again once the miss expires
+        negative_cache.remember("dbpedia_movie", movie_uri, negative_cache.NOT_FOUND)
+        return movie_struct
+    _store_movies([movie_struct])
     return movie_struct
 
+MOVIE_DATA_CHUNK_SIZE = 100
+
+def get_movie_data_many(movie_uris, ignore_cache=False, chunk_size=MOVIE_DATA_CHUNK_SIZE):
+    """Get movie data for many movies, fetching cache misses in batches.
+
+    movie_uris may be a list of uris or a dict of uri -> title (as returned by
+    MovieListComplete.get_movies()).  Returns a dict of uri -> movie struct;
+    movies whose batch failed to fetch are left out.
+    """
+    if isinstance(movie_uris, dict):
+        movie_titles = dict(movie_uris)
+    else:
+        movie_titles = {movie_uri: movie_uri.split("/")[-1] for movie_uri in movie_uris}
+    results = dict()
+    if not ignore_cache:
+        _check_memo_freshness()
+        store_misses = list()
+        for movie_uri in movie_titles:
+            found, structure = _movie_memo.get(movie_uri)
+            if found:
+                results[movie_uri] = structure
+            else:
+                store_misses.append(movie_uri)
+        # One bulk read for everything else already in the store
+        for movie_uri, structure in dbpedia_store.get_movies(store_misses).items():
+            if _is_complete(structure):
+                _movie_memo.put(movie_uri, structure)
+                results[movie_uri] = structure
+    misses = {movie_uri: movie_title for movie_uri, movie_title in movie_titles.items()
+              if movie_uri not in results}
+    if not ignore_cache:
+        for movie_uri, reason in negative_cache.check_many("dbpedia_movie", misses).items():
+            movie_struct = _negative_movie_result(movie_uri, misses.pop(movie_uri), reason)
+            if movie_struct:
+                results[movie_uri] = movie_struct
+    # Claim the misses; anything another session is already fetching we wait on instead
+    claimed = dict()
+    waiting = dict()
+    for movie_uri in misses:
+        call, is_leader = _flights.begin(("movie", movie_uri))
+        if is_leader:
+            claimed[movie_uri] = call
+        else:
+            waiting[movie_uri] = call
+    miss_uris = list(claimed)
+    finished = set()
+    failure = None
+    try:
+        for start in range(0, len(miss_uris), chunk_size):
+            chunk = {movie_uri: misses[movie_uri] for movie_uri in miss_uris[start:start + chunk_size]}
+            print(f"Looking up movie data for {len(chunk)} movies")
+            fetched = _fetch_movie_data(chunk)
+            if fetched is None:
+                for movie_uri in chunk:
+                    negative_cache.remember("dbpedia_movie", movie_uri, negative_cache.SERVER_ERROR)
+                    _flights.finish(("movie", movie_uri), claimed[movie_uri])
+                    finished.add(movie_uri)
+                continue
+            movie_structs = list()
+            for movie_uri, movie_title in chunk.items():
+                movie_struct = _apply_overrides(fetched.get(movie_uri) or _empty_movie_struct(movie_uri, movie_title))
+                if _is_empty_movie(movie_struct):
+                    negative_cache.remember("dbpedia_movie", movie_uri, negative_cache.NOT_FOUND)
+                else:
+                    movie_structs.append(movie_struct)
+                results[movie_uri] = movie_struct
+            _store_movies(movie_structs)
+            for movie_uri in chunk:
+                _flights.finish(("movie", movie_uri), claimed[movie_uri], result=results[movie_uri])
+                finished.add(movie_uri)
+    except BaseException as error:
+        failure = error
+        raise
+    finally:
+        # Whatever went wrong, release every claim so no waiter blocks for good
+        for movie_uri, call in claimed.items():
+            if movie_uri not in finished:
+                _flights.finish(("movie", movie_uri), call,
+                                error=failure or RuntimeError(f"Lookup of {movie_uri} was abandoned"))
+    for movie_uri, call in waiting.items():
+        movie_struct = call.wait()
+        if movie_struct:
+            results[movie_uri] = movie_struct
+    # Keep the caller's ordering
+    return {movie_uri: results[movie_uri] for movie_uri in movie_titles if movie_uri in results}
+
 def update_movie_data(movie_uri, new_data):
     """Replace movie data in the cache with new data."""
-    filename_safe_movie_id = movie_uri.replace("http://dbpedia.org/resource/", "")
-    filename_safe_movie_uri = filename_safe_movie_id.replace("/", "_")
-    cache_file = f"{dbpedia_cache}/{filename_safe_movie_uri}.json"
-    with open(cache_file, "w") as OUT:
-        OUT.write(json.dumps(new_data, indent=2))
+    new_data = copy.deepcopy(new_data)
+    new_data["uri"] = movie_uri
+    dbpedia_store.put_edited_movie(new_data)
+    _movie_memo.invalidate(movie_uri)
+
+def movies_edited_since(timestamp):
+    """Uris of the movies changed through update_movie_data at or after timestamp, a time.time() value."""
+    return dbpedia_store.movies_edited_since(timestamp)
 
 def get_person_thumbnail(person_uri):
     """Get the thumbnail image for a person."""
+    if _use_local():
+        return dbpedia_local.get_person_thumbnail(person_uri)
+    return _flights.do(("thumbnail", person_uri), _fetch_person_thumbnail, person_uri)
+
+def _fetch_person_thumbnail(person_uri):
     query = f"""
     PREFIX dbo: <http://dbpedia.org/ontology/>
     SELECT ?thumbnail
@@ -173,16 +370,35 @@ def get_person_thumbnail(person_uri):
     }}
     """
     url = "http://dbpedia.org/sparql"
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
+    response = http_util.get(url, params={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
+        negative_cache.remember("dbpedia_thumbnail", person_uri, negative_cache.reason_for_response(response))
         return None
     thumbnail_data = response.json()
     if len(thumbnail_data["results"]["bindings"]) == 0:
+        negative_cache.remember("dbpedia_thumbnail", person_uri, negative_cache.EMPTY_FIELD)
         return None
     return thumbnail_data["results"]["bindings"][0]["thumbnail"]["value"]
 
+def get_cast_thumbnail(person_uri, filmography):
+    """Return the thumbnail for a find_movies_by_cast(..., 'all') result.
+
+    If the filmography has none, look it up again, unless we already know
+    the person has none (or dbpedia just failed) and that is still fresh.
+    """
+    thumbnail = filmography.get("thumbnail")
+    if thumbnail or negative_cache.check("dbpedia_thumbnail", person_uri):
+        return thumbnail
+    thumbnail = get_person_thumbnail(person_uri)
+    if thumbnail:
+        dbpedia_store.set_thumbnail(person_uri, thumbnail)
+        _cast_memo.invalidate(person_uri)
+    return thumbnail
+
 def find_actor_by_uri(dbpedia_uri):
     """Find an actor by their dbpedia uri."""
+    if _use_local():
+        return dbpedia_local.find_person_by_uri(dbpedia_uri, "actor")
     result = dict()
     # First query verifies the given uri and gets the label (name)
     query = f"""
@@ -195,8 +411,8 @@ def find_actor_by_uri(dbpedia_uri):
     }}
     """
     url = "http://dbpedia.org/sparql"
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
+    response = http_util.get(url, params={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
         return None
     actor_data_with_bindings = response.json()
     result["uri"] = dbpedia_uri
@@ -210,8 +426,8 @@ def find_actor_by_uri(dbpedia_uri):
         ?movie dbo:starring <{dbpedia_uri}> .
     }}
     """
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
+    response = http_util.get(url, params={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
         return None
     movie_data_with_bindings = response.json()
     movies = list()
@@ -222,6 +438,8 @@ def find_actor_by_uri(dbpedia_uri):
 
 def find_director_by_uri(dbpedia_uri):
     """Find a director by their dbpedia uri."""
+    if _use_local():
+        return dbpedia_local.find_person_by_uri(dbpedia_uri, "director")
     result = dict()
     # First query verifies the given uri and gets the label (name)
     query = f"""
@@ -234,8 +452,8 @@ def find_director_by_uri(dbpedia_uri):
     }}
     """
     url = "http://dbpedia.org/sparql"
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
+    response = http_util.get(url, params={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
         return None
     director_data_with_bindings = response.json()
     result["uri"] = dbpedia_uri
@@ -249,8 +467,8 @@ def find_director_by_uri(dbpedia_uri):
         ?movie dbo:director <{dbpedia_uri}> .
     }}
     """
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
+    response = http_util.get(url, params={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
         return None
     movie_data_with_bindings = response.json()
     movies = list()
@@ -261,6 +479,8 @@ def find_director_by_uri(dbpedia_uri):
 
 def find_writer_by_uri(dbpedia_uri):
     """Find a writer by their dbpedia uri."""
+    if _use_local():
+        return dbpedia_local.find_person_by_uri(dbpedia_uri, "writer")
     result = dict()
     # First query verifies the given uri and gets the label (name)
     query = f"""
@@ -273,8 +493,8 @@ def find_writer_by_uri(dbpedia_uri):
     }}
     """
     url = "http://dbpedia.org/sparql"
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
+    response = http_util.get(url, params={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
         return None
     writer_data_with_bindings = response.json()
     result["uri"] = dbpedia_uri
@@ -288,8 +508,8 @@ def find_writer_by_uri(dbpedia_uri):
         ?movie dbo:writer <{dbpedia_uri}> .
     }}
     """
-    response = requests.get(url, params={"format": "json", "query": query})
-    if response.status_code != 200:
+    response = http_util.get(url, params={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
         return None
     movie_data_with_bindings = response.json()
     movies = list()
@@ -298,12 +518,116 @@ def find_writer_by_uri(dbpedia_uri):
     result["movies"] = movies
     return result
 
+def label_from_uri(uri):
+    """Readable stand-in for a label: the uri tail, unescaped, with spaces for underscores."""
+    return urllib.parse.unquote(uri.split("/")[-1]).replace("_", " ")
+
 def dbpedia_markdown_link(uri, label = None):
     """Return a markdown link for the given uri and label."""
     if label is None:
-        label = uri.split("/")[-1]
+        label = label_from_uri(uri)
     return f"[{label}]({uri})"
 
+LABEL_CHUNK_SIZE = 200
+
+def _fetch_person_labels(person_uris):
+    """Fetch english rdfs:labels for a list of uris in one sparql query.
+
+    Returns a dict of uri -> label for those that have one, or None if the query failed.
+    """
+    if _use_local():
+        return dbpedia_local.get_person_labels(person_uris)
+    values = " ".join(f"<{person_uri}>" for person_uri in person_uris)
+    query = f"""
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    SELECT ?person (SAMPLE(?label) AS ?name)
+    WHERE {{
+        VALUES ?person {{ {values} }}
+        ?person rdfs:label ?label .
+        FILTER (lang(?label) = "en")
+    }}
+    GROUP BY ?person
+    """
+    url = "http://dbpedia.org/sparql"
+    response = http_util.post(url, data={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
+        return None
+    return {row["person"]["value"]: row["name"]["value"] for row in response.json()["results"]["bindings"]}
+
+def get_person_labels(person_uris, chunk_size = LABEL_CHUNK_SIZE):
+    """Return uri -> display label for every given person.
+
+    Labels come from the store where we have them; the rest are fetched from
+    dbpedia chunk_size at a time and stored.  People dbpedia has no label for,
+    or couldn't be asked about, get label_from_uri() instead.
+    """
+    person_uris = list(dict.fromkeys(person_uris))
+    labels = dbpedia_store.get_labels(person_uris)
+    missing = [person_uri for person_uri in person_uris if person_uri not in labels]
+    known_misses = negative_cache.check_many("dbpedia_label", missing)
+    missing = [person_uri for person_uri in missing if person_uri not in known_misses]
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        fetched = _fetch_person_labels(chunk)
+        if fetched is None:
+            for person_uri in chunk:
+                negative_cache.remember("dbpedia_label", person_uri, negative_cache.SERVER_ERROR)
+            continue
+        for person_uri in chunk:
+            if person_uri not in fetched:
+                negative_cache.remember("dbpedia_label", person_uri, negative_cache.EMPTY_FIELD)
+        if fetched:
+            dbpedia_store.put_labels(fetched)
+        labels.update(fetched)
+    return {person_uri: labels.get(person_uri) or label_from_uri(person_uri) for person_uri in person_uris}
+
+
+def is_cast_cached(cast_uri):
+    """Return True if the full filmography for the cast member is already cached."""
+    return dbpedia_store.has_filmography(cast_uri)
+
+def find_person_filmography(dbpedia_uri):
+    """Find a person's label, thumbnail and movies in every role with one sparql query.
+
+    Returns the same wrapper shape as find_movies_by_cast(..., 'all'), or None
+    if the query failed.
+    """
+    if _use_local():
+        return dbpedia_local.find_person_filmography(dbpedia_uri)
+    query = f"""
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    PREFIX dbo: <http://dbpedia.org/ontology/>
+    SELECT ?role ?movie ?label ?thumbnail
+    WHERE {{
+        {{ <{dbpedia_uri}> rdfs:label ?label . FILTER (lang(?label) = 'en') }}
+        UNION {{ <{dbpedia_uri}> dbo:thumbnail ?thumbnail . }}
+        UNION {{ ?movie dbo:starring <{dbpedia_uri}> . BIND("actor" AS ?role) }}
+        UNION {{ ?movie dbo:director <{dbpedia_uri}> . BIND("director" AS ?role) }}
+        UNION {{ ?movie dbo:writer <{dbpedia_uri}> . BIND("writer" AS ?role) }}
+    }}
+    """
+    url = "http://dbpedia.org/sparql"
+    response = http_util.get(url, params={"format": "json", "query": query})
+    if response is None or response.status_code != 200:
+        return None
+    label = None
+    thumbnail = None
+    movies_by_role = {"actor": list(), "director": list(), "writer": list()}
+    for binding in response.json()["results"]["bindings"]:
+        if "label" in binding and label is None:
+            label = binding["label"]["value"]
+        elif "thumbnail" in binding and thumbnail is None:
+            thumbnail = binding["thumbnail"]["value"]
+        elif "role" in binding:
+            movies = movies_by_role[binding["role"]["value"]]
+            movie_uri = binding["movie"]["value"]
+            if movie_uri not in movies:
+                movies.append(movie_uri)
+    wrapper = dict()
+    for role, movies in movies_by_role.items():
+        wrapper[role] = {"uri": dbpedia_uri, "label": label, "movies": movies}
+    wrapper["thumbnail"] = thumbnail
+    return wrapper
 
 def find_movies_by_cast(selected_cast, selected_cast_role, ignore_cache=False):
     """Find movies by cast member."""
@@ -314,27 +638,48 @@ def find_movies_by_cast(selected_cast, selected_cast_role, ignore_cache=False):
     elif selected_cast_role == "actor":
         return find_actor_by_uri(selected_cast)
     elif selected_cast_role == "all":
-        cast_name = selected_cast.split("/")[-1]
-        cache_filename = f"{dbpedia_cache}/_CAST_{cast_name}.json"
-        if not ignore_cache and os.path.exists(cache_filename):
-            with open(cache_filename) as IN:
-                return json.load(IN)
-        wrapper = dict()
-        wrapper["actor"] = find_actor_by_uri(selected_cast)
-        wrapper["director"] = find_director_by_uri(selected_cast)
-        wrapper["writer"] = find_writer_by_uri(selected_cast)
-        wrapper["thumbnail"] = get_person_thumbnail(selected_cast)
-        with open(cache_filename, "w") as OUT:
-            OUT.write(json.dumps(wrapper, indent=2))
-        return wrapper
+        if not ignore_cache:
+            _check_memo_freshness()
+            found, wrapper = _cast_memo.get(selected_cast)
+            if found:
+                return wrapper
+            wrapper = dbpedia_store.get_filmography(selected_cast)
+            if wrapper is not None:
+                _cast_memo.put(selected_cast, wrapper)
+                return wrapper
+            if negative_cache.check("dbpedia_cast", selected_cast):
+                return None
+        return _flights.do(("cast", selected_cast), _load_filmography, selected_cast, ignore_cache)
     else:
         return {}
 
+def _load_filmography(person_uri, ignore_cache):
+    """Fetch and cache one person's filmography.  Runs once per person however many sessions ask at once."""
+    if not ignore_cache:
+        # Another session may have finished fetching it while we were checking
+        wrapper = dbpedia_store.get_filmography(person_uri)
+        if wrapper is not None:
+            _cast_memo.put(person_uri, wrapper)
+            return wrapper
+    wrapper = find_person_filmography(person_uri)
+    if wrapper is None:
+        negative_cache.remember("dbpedia_cast", person_uri, negative_cache.SERVER_ERROR)
+        _cast_memo.invalidate(person_uri)
+        return None
+    if not wrapper["thumbnail"]:
+        negative_cache.remember("dbpedia_thumbnail", person_uri, negative_cache.EMPTY_FIELD)
+    dbpedia_store.put_filmography(person_uri, wrapper)
+    _cast_memo.put(person_uri, wrapper)
+    return wrapper
+
 def search_for_person_in_wikipedia(search_term):
     """Search for a person in wikipedia."""
+    if _use_local():
+        # Offline, search the people in the local store instead
+        return dbpedia_local.search_for_person(search_term)
     search_term = search_term.replace(" ", "_")
     url = f"https://en.wikipedia.org/w/api.php?action=query&format=json&list=search&srsearch={search_term}"
-    response = requests.get(url)
-    if response.status_code != 200:
+    response = http_util.get(url)
+    if response is None or response.status_code != 200:
         return None
     return response.json().get("query",{}).get("search",[])
@@ -0,0 +1,309 @@
+# Embedded sqlite store for the dbpedia cache.
+# Replaces the one-json-file-per-entity dbpedia_cache directory with a single
+# indexed database holding movies, people and their filmographies, keyed by
+# uri.  The old directory is migrated in the first time the store is opened.
+
+import glob
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import cache_format
+
+DBPEDIA_CACHE_DIR = "dbpedia_cache"
+STORE_FILE = f"{DBPEDIA_CACHE_DIR}/dbpedia_cache.sqlite3"
+ROLES = ("actor", "director", "writer")
+
+# sqlite caps the number of ? parameters in one statement
+_MAX_PARAMS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    uri TEXT PRIMARY KEY,
+    title TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS people (
+    uri TEXT PRIMARY KEY,
+    label TEXT,
+    thumbnail TEXT,
+    filmography_fetched INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS filmographies (
+    person_uri TEXT NOT NULL,
+    role TEXT NOT NULL,
+    movie_uri TEXT NOT NULL,
+    PRIMARY KEY (person_uri, role, movie_uri)
+);
+CREATE INDEX IF NOT EXISTS filmographies_by_movie ON filmographies (movie_uri);
+CREATE TABLE IF NOT EXISTS titles (
+    uri TEXT PRIMARY KEY,
+    title TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS movie_edits (
+    uri TEXT PRIMARY KEY,
+    edited_at REAL NOT NULL
+);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+# mtimes of the store files as of this process's last write.  Anything else
+# moving them means another process wrote to the store.
+_known_stamp = None
+_stamp_lock = threading.Lock()
+
+
+def _stamp(store_file: str = STORE_FILE) -> tuple:
+    stamp = list()
+    for path in (store_file, store_file + "-wal"):
+        try:
+            stamp.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def _note_local_write() -> None:
+    global _known_stamp
+    with _stamp_lock:
+        _known_stamp = _stamp()
+
+
+def changed_externally() -> bool:
+    """Return True if another process has written to the store since we last looked."""
+    global _known_stamp
+    stamp = _stamp()
+    with _stamp_lock:
+        if _known_stamp is None:
+            _known_stamp = stamp
+            return False
+        if stamp == _known_stamp:
+            return False
+        _known_stamp = stamp
+        return True
+
+
+def connect(store_file: str = STORE_FILE) -> sqlite3.Connection:
+    """Return this thread's connection to the store, creating the store if needed."""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = dict()
+    connection = connections.get(store_file)
+    if connection is None:
+        os.makedirs(os.path.dirname(store_file) or ".", exist_ok=True)
+        with _init_lock:
+            is_new = not os.path.exists(store_file)
+            connection = sqlite3.connect(store_file, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            if store_file not in _initialized:
+                connection.executescript(_SCHEMA)
+                _initialized.add(store_file)
+                if is_new and store_file == STORE_FILE:
+                    migrate_from_directory(DBPEDIA_CACHE_DIR, connection)
+        connections[store_file] = connection
+    return connection
+
+
+def _chunks(items, size=_MAX_PARAMS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def get_movie(movie_uri: str):
+    """Return the stored movie struct, or None."""
+    row = connect().execute("SELECT data FROM movies WHERE uri = ?", (movie_uri,)).fetchone()
+    if row is None:
+        return None
+    return cache_format.decode(row[0])
+
+
+def get_movies(movie_uris) -> dict:
+    """Return a dict of uri -> movie struct for every stored movie among the given uris."""
+    connection = connect()
+    results = dict()
+    for chunk in _chunks(list(movie_uris)):
+        placeholders = ",".join("?" * len(chunk))
+        query = f"SELECT uri, data FROM movies WHERE uri IN ({placeholders})"
+        for uri, data in connection.execute(query, chunk):
+            results[uri] = cache_format.decode(data)
+    return results
+
+
+def get_movie_titles() -> list:
+    """Return (uri, title) for every stored movie, without decoding the structs."""
+    return connect().execute("SELECT uri, title FROM movies").fetchall()
+
+
+def _movie_row(movie_struct: dict) -> tuple:
+    return movie_struct["uri"], movie_struct.get("title"), cache_format.encode(movie_struct)
+
+
+def put_movies(movie_structs) -> None:
+    """Insert or replace movie structs in one transaction."""
+    rows = [_movie_row(movie_struct) for movie_struct in movie_structs]
+    connection = connect()
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO movies (uri, title, data) VALUES (?, ?, ?)", rows)
+    _note_local_write()
+
+
+def put_movie(movie_struct: dict) -> None:
+    put_movies([movie_struct])
+
+
+def put_edited_movie(movie_struct: dict) -> None:
+    """Store a movie struct changed by hand, noting when; see movies_edited_since."""
+    connection = connect()
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO movies (uri, title, data) VALUES (?, ?, ?)",
+                           _movie_row(movie_struct))
+        connection.execute("INSERT OR REPLACE INTO movie_edits (uri, edited_at) VALUES (?, ?)",
+                           (movie_struct["uri"], time.time()))
+    _note_local_write()
+
+
+def movies_edited_since(timestamp: float) -> list:
+    """Uris of the movies put_edited_movie stored at or after timestamp, a time.time() value."""
+    query = "SELECT uri FROM movie_edits WHERE edited_at >= ?"
+    return [uri for (uri,) in connect().execute(query, (timestamp,))]
+
+
+def get_titles() -> list:
+    """Return (uri, title) for every film title remembered from a search."""
+    return connect().execute("SELECT uri, title FROM titles").fetchall()
+
+
+def put_titles(pairs) -> None:
+    """Remember (uri, title) pairs seen in search results."""
+    connection = connect()
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO titles (uri, title) VALUES (?, ?)", list(pairs))
+    _note_local_write()
+
+
+def has_filmography(person_uri: str) -> bool:
+    row = connect().execute("SELECT filmography_fetched FROM people WHERE uri = ?", (person_uri,)).fetchone()
+    return bool(row and row[0])
+
+
+def get_filmography(person_uri: str):
+    """Return the find_movies_by_cast(..., 'all') wrapper for the person, or None."""
+    connection = connect()
+    row = connection.execute("SELECT label, thumbnail, filmography_fetched FROM people WHERE uri = ?",
+                             (person_uri,)).fetchone()
+    if row is None or not row[2]:
+        return None
+    label, thumbnail, _ = row
+    wrapper = dict()
+    for role in ROLES:
+        wrapper[role] = {"uri": person_uri, "label": label, "movies": list()}
+    query = "SELECT role, movie_uri FROM filmographies WHERE person_uri = ? ORDER BY rowid"
+    for role, movie_uri in connection.execute(query, (person_uri,)):
+        wrapper[role]["movies"].append(movie_uri)
+    wrapper["thumbnail"] = thumbnail
+    return wrapper
+
+
+def put_filmography(person_uri: str, wrapper: dict, connection: sqlite3.Connection = None) -> None:
+    """Store a find_movies_by_cast(..., 'all') wrapper for the person."""
+    connection = connection or connect()
+    label = None
+    for role in ROLES:
+        if wrapper.get(role) and wrapper[role].get("label"):
+            label = wrapper[role]["label"]
+            break
+    with connection:
+        connection.execute(
+            "INSERT INTO people (uri, label, thumbnail, filmography_fetched) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT(uri) DO UPDATE SET label = COALESCE(excluded.label, label), "
+            "thumbnail = COALESCE(excluded.thumbnail, thumbnail), filmography_fetched = 1",
+            (person_uri, label, wrapper.get("thumbnail")))
+        connection.execute("DELETE FROM filmographies WHERE person_uri = ?", (person_uri,))
+        rows = list()
+        for role in ROLES:
+            for movie_uri in (wrapper.get(role) or {}).get("movies", []):
+                rows.append((person_uri, role, movie_uri))
+        connection.executemany(
+            "INSERT OR IGNORE INTO filmographies (person_uri, role, movie_uri) VALUES (?, ?, ?)", rows)
+    _note_local_write()
+
+
+def get_labels(person_uris) -> dict:
+    """Return uri -> label for every person among the given uris whose label is stored."""
+    connection = connect()
+    labels = dict()
+    for chunk in _chunks(list(person_uris)):
+        placeholders = ",".join("?" * len(chunk))
+        query = f"SELECT uri, label FROM people WHERE label IS NOT NULL AND uri IN ({placeholders})"
+        labels.update(connection.execute(query, chunk))
+    return labels
+
+
+def put_labels(labels: dict) -> None:
+    """Store person labels, leaving any stored filmography and thumbnail alone."""
+    connection = connect()
+    with connection:
+        connection.executemany("INSERT INTO people (uri, label) VALUES (?, ?) "
+                               "ON CONFLICT(uri) DO UPDATE SET label = excluded.label",
+                               list(labels.items()))
+    _note_local_write()
+
+
+def set_thumbnail(person_uri: str, thumbnail: str) -> None:
+    connection = connect()
+    with connection:
+        connection.execute("INSERT INTO people (uri, thumbnail) VALUES (?, ?) "
+                           "ON CONFLICT(uri) DO UPDATE SET thumbnail = excluded.thumbnail",
+                           (person_uri, thumbnail))
+    _note_local_write()
+
+
+def migrate_from_directory(cache_dir: str = DBPEDIA_CACHE_DIR, connection: sqlite3.Connection = None) -> tuple:
+    """Load the legacy per-entity json files from cache_dir into the store.
+
+    Override files (cache_dir/overrides) are left where they are.  Returns the
+    number of (movies, people) migrated.
+    """
+    connection = connection or connect()
+    movie_structs = list()
+    people = 0
+    for path in glob.glob(f"{cache_dir}/*.json"):
+        name = os.path.basename(path)[:-len(".json")]
+        try:
+            with open(path) as IN:
+                structure = json.load(IN)
+        except (OSError, ValueError) as error:
+            print(f"Skipping unreadable cache file {path}: {error}")
+            continue
+        if name.startswith("_CAST_"):
+            person_uri = None
+            for role in ROLES:
+                if structure.get(role) and structure[role].get("uri"):
+                    person_uri = structure[role]["uri"]
+                    break
+            if person_uri is None:
+                person_uri = "http://dbpedia.org/resource/" + name[len("_CAST_"):]
+            put_filmography(person_uri, structure, connection)
+            people += 1
+        elif isinstance(structure, dict) and "uri" in structure:
+            movie_structs.append(structure)
+    rows = [(movie_struct["uri"], movie_struct.get("title"), cache_format.encode(movie_struct))
+            for movie_struct in movie_structs]
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO movies (uri, title, data) VALUES (?, ?, ?)", rows)
+    print(f"Migrated {len(movie_structs)} movies and {people} filmographies from {cache_dir}")
+    return len(movie_structs), people
+
+
+if __name__ == "__main__":
+    # python dbpedia_store.py migrate [cache_dir]
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        migrate_from_directory(sys.argv[2] if len(sys.argv) > 2 else DBPEDIA_CACHE_DIR)
+    else:
+        print("usage: python dbpedia_store.py migrate [cache_dir]")
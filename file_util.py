@@ -0,0 +1,20 @@
+# Small file helpers shared by the caches.
+
+import os
+import tempfile
+
+
+def atomic_write(path: str, text) -> None:
+    """Write text (str or bytes) to path so readers see either the old file or the whole new one, never half of it."""
+    directory = os.path.dirname(path) or "."
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(handle, "wb" if isinstance(text, bytes) else "w") as OUT:
+            OUT.write(text)
+            OUT.flush()
+            os.fsync(OUT.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
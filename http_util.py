@@ -0,0 +1,191 @@
+# Shared HTTP client for the dbpedia, omdb, tmdb and wikipedia lookups.
+# Keeps one pooled keep-alive session per host, applies timeouts, caps how
+# many requests run against a host at once and retries 429/5xx responses
+# with jittered exponential backoff.  Hosts in ADAPTIVE_HOSTS go through an
+# adaptive limiter instead of a fixed cap (see rate_limit_util).
+
+import contextlib
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import rate_limit_util
+
+# Timeouts in seconds: (connect, read).  DBpedia queries can be slow to
+# answer, so the read timeout is generous.
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+
+# Retry policy for throttled or failing responses and connection errors.
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# How many requests may be in flight against one host at a time.
+MAX_CONCURRENCY_PER_HOST = 4
+HOST_CONCURRENCY = {
+    "dbpedia.org": 4,
+    "www.omdbapi.com": 4,
+    "api.themoviedb.org": 8,
+    "en.wikipedia.org": 4,
+}
+
+# Hosts whose rate and concurrency adapt to how the server is coping.
+ADAPTIVE_HOSTS = {"dbpedia.org"}
+
+_sessions = dict()
+_semaphores = dict()
+_limiters = dict()
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure(connect_timeout=None, read_timeout=None, max_retries=None, host_concurrency=None):
+    """Override the default timeouts, retry count and per-host concurrency caps."""
+    global CONNECT_TIMEOUT, READ_TIMEOUT, MAX_RETRIES
+    if connect_timeout is not None:
+        CONNECT_TIMEOUT = connect_timeout
+    if read_timeout is not None:
+        READ_TIMEOUT = read_timeout
+    if max_retries is not None:
+        MAX_RETRIES = max_retries
+    if host_concurrency:
+        with _lock:
+            HOST_CONCURRENCY.update(host_concurrency)
+            # Semaphores are rebuilt with the new caps on next use
+            for host in host_concurrency:
+                _semaphores.pop(host, None)
+                _sessions.pop(host, None)
+
+
+def _host_limit(host):
+    if host in ADAPTIVE_HOSTS:
+        return int(rate_limit_util.MAX_CONCURRENCY)
+    return HOST_CONCURRENCY.get(host, MAX_CONCURRENCY_PER_HOST)
+
+
+@contextlib.contextmanager
+def background():
+    """Mark requests made by this thread inside the block as background work.
+
+    Background requests to an adaptive host wait while any interactive request
+    is queued for it.
+    """
+    previous = getattr(_local, "background", False)
+    _local.background = True
+    try:
+        yield
+    finally:
+        _local.background = previous
+
+
+def is_background() -> bool:
+    return getattr(_local, "background", False)
+
+
+def get_session(host):
+    """Return the pooled session for the given host, creating it if needed."""
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_host_limit(host))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def _host_semaphore(host):
+    with _lock:
+        semaphore = _semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(_host_limit(host))
+            _semaphores[host] = semaphore
+        return semaphore
+
+
+def get_limiter(host):
+    """Return the adaptive limiter for the given host, or None if the host has a fixed cap."""
+    if host not in ADAPTIVE_HOSTS:
+        return None
+    with _lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = rate_limit_util.AdaptiveLimiter()
+        return limiter
+
+
+def limiter_metrics() -> dict:
+    """Return host -> current limits and queue depth for every adaptive host in use."""
+    with _lock:
+        limiters = dict(_limiters)
+    return {host: limiter.metrics() for host, limiter in limiters.items()}
+
+
+def _send(session, host, method, url, **kwargs):
+    """Send one request under the host's limiter or semaphore."""
+    limiter = get_limiter(host)
+    if limiter is None:
+        with _host_semaphore(host):
+            return session.request(method, url, **kwargs)
+    limiter.acquire(background=is_background())
+    started = time.monotonic()
+    response = None
+    try:
+        response = session.request(method, url, **kwargs)
+    finally:
+        status_code = response.status_code if response is not None else None
+        retry_after = rate_limit_util.parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        limiter.release(status_code, time.monotonic() - started, retry_after)
+    return response
+
+
+def _backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given (zero based) attempt."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def request(method, url, **kwargs):
+    """Send a request through the shared client.
+
+    Returns the final response (which may still be an error status once the
+    retries are used up), or None if every attempt failed to connect.
+    """
+    host = urlparse(url).hostname
+    session = get_session(host)
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    response = None
+    for attempt in range(MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            response = _send(session, host, method, url, **kwargs)
+        except requests.RequestException as error:
+            print(f"Request to {host} failed: {error}")
+            response = None
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            print(f"Request to {host} returned {response.status_code}")
+            retry_after = rate_limit_util.parse_retry_after(response.headers.get("Retry-After"))
+        if attempt < MAX_RETRIES:
+            delay = _backoff_delay(attempt)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, BACKOFF_MAX))
+            time.sleep(delay)
+    return response
+
+
+def get(url, **kwargs):
+    """GET through the shared client.  See request()."""
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    """POST through the shared client.  See request()."""
+    return request("POST", url, **kwargs)
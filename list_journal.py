@@ -0,0 +1,236 @@
+# Write-ahead journal and multi-process safe storage for the movie lists.
+# Each change to a list is appended as one json line and fsynced, instead of
+# rewriting the whole list file.  Loading a list reads its snapshot and then
+# replays the journal; every so often the list is compacted into a fresh
+# snapshot (written to a temp file and renamed into place) and the journal
+# starts over.
+#
+# The first line of a journal names the snapshot generation it applies to,
+# so a journal left over from before a compaction is never replayed twice.
+# The generation plus how far into the journal a list has read is the list's
+# version.  A writer holding the exclusive lock first catches up on whatever
+# other sessions or processes committed since its version, then appends its
+# own changes after theirs, so nobody's changes are dropped.  Without fcntl
+# (Windows) there is no lock, and only a single server process is safe.
+
+import contextlib
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import cache_format
+import file_util
+
+# Compact into a new snapshot once the journal holds this many changes
+COMPACT_AFTER_ENTRIES = 1000
+
+
+def _drop_torn_tail(OUT, size: int) -> int:
+    """Cut the file back to its last complete line.  Returns the new size."""
+    start = max(0, size - 65536)
+    OUT.seek(start)
+    end = OUT.read().rfind(b"\n")
+    size = start + end + 1 if end >= 0 else start
+    OUT.truncate(size)
+    return size
+
+
+def _header_generation(header: bytes):
+    """The generation named by a journal's first line, or None if it has no complete header."""
+    if not header.endswith(b"\n"):
+        return None
+    try:
+        return json.loads(header)["generation"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class ListJournal:
+    """Append-only log of list mutations, one json array per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        # How far into the journal we have read or written, in bytes
+        self.offset = 0
+
+    @contextlib.contextmanager
+    def locked(self, exclusive: bool = True):
+        """Hold the list's advisory lock: exclusive for committing, shared for loading."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as LOCK:
+            fcntl.flock(LOCK.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(LOCK.fileno(), fcntl.LOCK_UN)
+
+    def read(self) -> tuple:
+        """Return (generation, entries) for the whole journal; (None, []) if there is none yet."""
+        self.offset = 0
+        return self.read_new()
+
+    def read_new(self) -> tuple:
+        """Return (generation, entries) appended since our last read or append.
+
+        If the journal was reset for a new generation in the meantime, the
+        entries are the whole new journal.
+        """
+        entries = list()
+        if not os.path.exists(self.path):
+            self.offset = 0
+            return None, entries
+        with open(self.path, "rb") as IN:
+            header = IN.readline()
+            generation = _header_generation(header)
+            if generation is None:
+                self.offset = 0
+                return None, entries
+            position = max(self.offset, len(header))
+            IN.seek(position)
+            for line in IN:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated line")
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # The tail of an append cut short by a crash
+                    break
+                position += len(line)
+            self.offset = position
+        return generation, entries
+
+    def append(self, generation: int, entries) -> None:
+        """Append entries and fsync, starting the journal for generation if it is
+        empty or belongs to another generation."""
+        lines = [json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries]
+        with open(self.path, "a+b") as OUT:
+            size = OUT.seek(0, os.SEEK_END)
+            if size:
+                OUT.seek(0)
+                if _header_generation(OUT.readline()) != generation:
+                    # Left by a compaction cut short after its snapshot was
+                    # written; the snapshot already holds these entries
+                    OUT.truncate(0)
+                    size = 0
+            if size:
+                OUT.seek(size - 1)
+                if OUT.read(1) != b"\n":
+                    # Drop a line torn by a crash so what follows stays readable
+                    size = _drop_torn_tail(OUT, size)
+            if size == 0:
+                lines.insert(0, json.dumps({"generation": generation}) + "\n")
+            data = "".join(lines).encode("utf-8")
+            OUT.write(data)
+            OUT.flush()
+            os.fsync(OUT.fileno())
+            self.offset = size + len(data)
+
+    def reset(self, generation: int) -> None:
+        """Start an empty journal for a freshly written snapshot."""
+        header = json.dumps({"generation": generation}) + "\n"
+        file_util.atomic_write(self.path, header)
+        self.offset = len(header)
+
+
+class JournaledList:
+    """Snapshot plus journal storage shared by the movie list classes.
+
+    Subclasses set cache_file, call _init_journal() and _load() from
+    __init__, call _record() from each mutation and implement _clear(),
+    _load_snapshot(), _snapshot() and _apply().  Applying an entry that no
+    longer applies (say, removing a movie another writer already removed)
+    must be harmless.
+    """
+
+    def _init_journal(self):
+        # Changes since the snapshot in cache_file
+        self.journal = ListJournal(f"{self.cache_file}.journal")
+        self.generation = 0
+        self.journal_entries = 0
+        self.pending = list()
+        self.replaying = False
+
+    def _load(self):
+        """Load the snapshot and replay the journal, under the shared lock."""
+        with self.journal.locked(exclusive=False):
+            self._load_unlocked()
+
+    def _load_unlocked(self):
+        self.replaying = True
+        try:
+            self._clear()
+            self.generation = 0
+            if os.path.exists(self.cache_file):
+                snapshot = cache_format.read(self.cache_file)
+                self._load_snapshot(snapshot)
+                if isinstance(snapshot, dict):
+                    self.generation = snapshot.get("generation", 0)
+        finally:
+            self.replaying = False
+        generation, entries = self.journal.read()
+        self.journal_entries = 0
+        if generation == self.generation:
+            self._replay(entries)
+
+    def _replay(self, entries):
+        self.replaying = True
+        try:
+            for entry in entries:
+                self._apply(entry)
+        finally:
+            self.replaying = False
+        self.journal_entries += len(entries)
+
+    def _record(self, *entry):
+        if not self.replaying:
+            self.pending.append(list(entry))
+
+    def _catch_up(self):
+        """Merge in what other writers committed since our version.  Call under the exclusive lock."""
+        generation, entries = self.journal.read_new()
+        if generation == self.generation and not entries:
+            return
+        # Rebuild from disk and redo our changes after theirs, so memory ends
+        # up in the same order as the journal (the first to commit a
+        # conflicting add keeps it)
+        self._load_unlocked()
+        self._replay(self.pending)
+        self.journal_entries -= len(self.pending)
+
+    def write(self):
+        """Commit the changes made since the last write, merging in other writers' changes first."""
+        with self.journal.locked():
+            self._catch_up()
+            if self.journal_entries + len(self.pending) >= COMPACT_AFTER_ENTRIES:
+                self._compact_unlocked()
+            elif self.pending:
+                self.journal.append(self.generation, self.pending)
+                self.journal_entries += len(self.pending)
+                self.pending = list()
+
+    def refresh(self):
+        """Pick up changes other writers committed since we loaded or last wrote."""
+        with self.journal.locked():
+            self._catch_up()
+
+    def compact(self):
+        """Write the whole list as a new snapshot and start an empty journal."""
+        with self.journal.locked():
+            self._catch_up()
+            self._compact_unlocked()
+
+    def _compact_unlocked(self):
+        self.generation += 1
+        snapshot = self._snapshot()
+        snapshot["generation"] = self.generation
+        cache_format.write(self.cache_file, snapshot)
+        self.journal.reset(self.generation)
+        self.journal_entries = 0
+        self.pending = list()
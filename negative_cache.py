@@ -0,0 +1,100 @@
+# Remember failed and empty lookups against dbpedia, omdb and tmdb.
+# Each miss is stored with a reason and an expiry, so we stop asking the APIs
+# about entities we already know are missing, but still try again later.
+
+import os
+import sqlite3
+import threading
+import time
+
+NEGATIVE_CACHE_DIR = "negative_cache"
+NEGATIVE_CACHE_FILE = f"{NEGATIVE_CACHE_DIR}/negative_cache.sqlite3"
+
+# Reasons a lookup is remembered as a miss
+NOT_FOUND = "not_found"  # the source says the entity doesn't exist
+SERVER_ERROR = "server_error"  # the request failed (5xx, throttled, no connection)
+EMPTY_FIELD = "empty_field"  # the entity exists but a field we want is empty
+
+# How long each kind of miss is trusted, in seconds
+TTLS = {
+    NOT_FOUND: 7 * 24 * 3600,
+    SERVER_ERROR: 10 * 60,
+    EMPTY_FIELD: 3 * 24 * 3600,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS misses (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (source, key)
+);
+"""
+
+_local = threading.local()
+
+
+def connect() -> sqlite3.Connection:
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        os.makedirs(NEGATIVE_CACHE_DIR, exist_ok=True)
+        connection = sqlite3.connect(NEGATIVE_CACHE_FILE, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        _local.connection = connection
+    return connection
+
+
+def remember(source: str, key: str, reason: str, ttl: float = None) -> None:
+    """Record that looking up key in source missed for the given reason."""
+    expires_at = time.time() + (TTLS[reason] if ttl is None else ttl)
+    connection = connect()
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO misses (source, key, reason, expires_at) VALUES (?, ?, ?, ?)",
+                           (source, key, reason, expires_at))
+
+
+def check(source: str, key: str):
+    """Return the reason for a remembered, unexpired miss, or None."""
+    row = connect().execute("SELECT reason, expires_at FROM misses WHERE source = ? AND key = ?",
+                            (source, key)).fetchone()
+    if row is None or row[1] < time.time():
+        return None
+    return row[0]
+
+
+def check_many(source: str, keys) -> dict:
+    """Return key -> reason for every remembered, unexpired miss among keys."""
+    keys = list(keys)
+    misses = dict()
+    now = time.time()
+    connection = connect()
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        query = f"SELECT key, reason, expires_at FROM misses WHERE source = ? AND key IN ({placeholders})"
+        for key, reason, expires_at in connection.execute(query, [source] + chunk):
+            if expires_at >= now:
+                misses[key] = reason
+    return misses
+
+
+def forget(source: str, key: str) -> None:
+    connection = connect()
+    with connection:
+        connection.execute("DELETE FROM misses WHERE source = ? AND key = ?", (source, key))
+
+
+def reason_for_response(response) -> str:
+    """Classify a failed http response (or None, for no connection) as a miss reason."""
+    if response is not None and response.status_code == 404:
+        return NOT_FOUND
+    return SERVER_ERROR
+
+
+def purge_expired() -> int:
+    """Delete expired entries.  Returns how many were removed."""
+    connection = connect()
+    with connection:
+        return connection.execute("DELETE FROM misses WHERE expires_at < ?", (time.time(),)).rowcount
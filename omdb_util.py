@@ -2,7 +2,11 @@
 
 import json
 import os
-import requests
+
+import cache_format
+import http_util
+import negative_cache
+import singleflight_util
 
 OMDB_CACHE = "omdb_cache"
 os.makedirs(OMDB_CACHE, exist_ok=True)
@@ -14,30 +18,58 @@ if not OMDB_API_KEY:
         config = json.load(IN)
         OMDB_API_KEY = config["OMDB_API_KEY"]
 
+def _not_found_response():
+    return {"Response": "False", "Error": "Movie not found!"}
+
+# Concurrent sessions asking for the same uncached title share one API call
+_flights = singleflight_util.SingleFlight()
+
 def get_cached_movie_details(movie_title):
     """Get the movie details from the OMDB API, caching the results."""
     cache_file = f"{OMDB_CACHE}/{movie_title}.json"
     if os.path.exists(cache_file):
-        with open(cache_file) as IN:
-            return json.load(IN)
+        return cache_format.read(cache_file)
+    reason = negative_cache.check("omdb_movie", movie_title)
+    if reason:
+        return _not_found_response() if reason == negative_cache.NOT_FOUND else None
     # Otherwise call the API and cache the results
+    return _flights.do(movie_title, _fetch_movie_details, movie_title, cache_file)
+
+def _fetch_movie_details(movie_title, cache_file):
+    if os.path.exists(cache_file):
+        # Written by another session while we were checking
+        return cache_format.read(cache_file)
     url = f"http://www.omdbapi.com/?apikey={OMDB_API_KEY}&t={movie_title}"
-    result = requests.get(url)
-    if result.status_code != 200:
+    result = http_util.get(url)
+    if result is None or result.status_code != 200:
+        negative_cache.remember("omdb_movie", movie_title, negative_cache.reason_for_response(result))
         return None
     movie = result.json()
-    with open(cache_file, "w") as OUT:
-        OUT.write(json.dumps(movie, indent=2))
+    if movie.get("Response") == "False":
+        # OMDB answers a missing title with a 200; remember it for a while instead of for good
+        negative_cache.remember("omdb_movie", movie_title, negative_cache.NOT_FOUND)
+        return movie
+    cache_format.write(cache_file, movie)
     return movie
 
 def search_for_movie(search_term):
     """Search for a movie by title using the OMDB API."""
     print("Searching for movie with omdb")
+    reason = negative_cache.check("omdb_search", search_term)
+    if reason:
+        return _not_found_response() if reason == negative_cache.NOT_FOUND else None
     search_url = f"http://www.omdbapi.com/?apikey={OMDB_API_KEY}&s={search_term}"
-    response = requests.get(search_url)
+    response = http_util.get(search_url)
+    if response is None:
+        negative_cache.remember("omdb_search", search_term, negative_cache.SERVER_ERROR)
+        return None
     if response.status_code != 200:
         print(f"Error: {response.status_code}")
         print(response.text)
+        negative_cache.remember("omdb_search", search_term, negative_cache.reason_for_response(response))
         return None
-    return response.json()
+    results = response.json()
+    if results.get("Response") == "False":
+        negative_cache.remember("omdb_search", search_term, negative_cache.NOT_FOUND)
+    return results
 
@@ -1,53 +1,51 @@
 # This script pulls out all identifiable english language movies from DBPedia and sorts them by gross revenue.
 
-
-import json
-import os
-from typing import List
-
-import requests
 import streamlit
 
-def get_all_dbpedia_movies():
-    """Return all identifiable movies along with their titles and gross revenue."""
-    # This query will need to be paginated to get everything
-    cache_file = "dbpedia_movies.json"
-    if os.path.exists(cache_file):
-        with open(cache_file) as IN:
-            return json.load(IN)
-    url = "https://dbpedia.org/sparql"
-    all_movies = list()
-    done = False
-    offset = 0
-    while not done:
-        streamlit.write(f"Fetching movies ({len(all_movies)} so far)")
-        query = f"""
-        PREFIX dbo: <http://dbpedia.org/ontology/>
-        PREFIX dbp: <http://dbpedia.org/property/>
-        SELECT ?title ?gross
-        WHERE {{
-            ?movie a dbo:Film ;
-                dbp:gross ?gross ;
-                dbp:name ?title .
-        }}
-        LIMIT 100
-        OFFSET {offset}
-        """
-        response = requests.post(url, data={"query": query})
-        response_json = response.json()
-        movies = response_json["results"]["bindings"]
-        all_movies.extend(movies)
-        if len(movies) < 100:
-            done = True
-        offset += 100
-        with open(cache_file, "w") as OUT:
-            json.dump(all_movies, OUT, indent=2)
-    return all_movies
+import dbpedia_bulk_pull
+import popular_movies
+
+PAGE_SIZE = 50
 
 streamlit.title("Most Popular Movies")
-movies = get_all_dbpedia_movies()
-# for movie in movies[:5000]:
-#     streamlit.write(f"{movie['title']['value']} made {movie['gross']['value']}")
 
-streamlit.write(f"Found {len(movies)} movies.")
-streamlit.json(movies[:5000])
+# The pull runs as a background job (or from the command line with
+# python dbpedia_bulk_pull.py); this page only starts it and shows what it has so far.
+bulk_pull = dbpedia_bulk_pull.get_bulk_pull()
+if bulk_pull.is_running():
+    pull_progress = bulk_pull.progress()
+    streamlit.write(f"Pulling movies from dbpedia: {pull_progress['films']} films from {pull_progress['pages_done']} pages so far")
+    if streamlit.button("Refresh"):
+        streamlit.experimental_rerun()
+    if streamlit.button("Stop pulling"):
+        bulk_pull.stop()
+        streamlit.experimental_rerun()
+else:
+    if bulk_pull.progress()["error"]:
+        streamlit.error(bulk_pull.progress()["error"])
+    if not bulk_pull.is_complete() and streamlit.button("Pull movies from dbpedia (resumes where it stopped)"):
+        bulk_pull.start()
+        streamlit.experimental_rerun()
+
+columns = popular_movies.get_columns()
+ranked_count = len(columns.ranked)
+streamlit.write(f"Found {len(columns)} movies, {ranked_count} with a gross in US dollars.")
+if not ranked_count:
+    streamlit.stop()
+
+percentiles = columns.percentiles([50, 90, 99])
+# metric rather than write: markdown reads "$...$" as inline math
+for column, (label, percentile) in zip(streamlit.columns(3),
+                                       (("Median gross", 50), ("90th percentile", 90), ("99th percentile", 99))):
+    column.metric(label, "${:,.0f}".format(percentiles[percentile]))
+
+min_millions = streamlit.sidebar.number_input("Minimum gross ($ millions)", min_value=0.0, value=0.0)
+max_millions = streamlit.sidebar.number_input("Maximum gross ($ millions, 0 for no limit)", min_value=0.0, value=0.0)
+min_gross = min_millions * 1e6 if min_millions else None
+max_gross = max_millions * 1e6 if max_millions else None
+
+matching = columns.count(min_gross, max_gross)
+page_count = max(1, (matching + PAGE_SIZE - 1) // PAGE_SIZE)
+page_number = streamlit.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+streamlit.write(f"{matching} movies in range, ranked by gross")
+streamlit.dataframe(columns.page(page_number - 1, PAGE_SIZE, min_gross, max_gross), use_container_width=True)
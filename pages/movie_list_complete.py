@@ -3,6 +3,8 @@
 import streamlit
 
 import dbpedia_movie_util
+import prefetch_util
+import thumbnail_store
 from unique_movie_list import MovieListComplete
 
 my_complete_movie_list = MovieListComplete("tom_zielund_complete_movies")
@@ -14,12 +16,14 @@ default_cast_member_uri = ""
 non_acknowledged_count = 0
 reverse_movie_list = list(my_complete_movie_list.get_movies().keys())
 reverse_movie_list.reverse()
+if show_acknowledged:
+    all_movie_data = dbpedia_movie_util.get_movie_data_many(my_complete_movie_list.get_movies())
 for movie in reverse_movie_list:
     movie_title = movie.split("/")[-1]
     acknowledged = ""
-    if show_acknowledged:
+    if show_acknowledged and movie in all_movie_data:
         acknowledged = "(ack)"
-        dbpedia_details = dbpedia_movie_util.get_movie_data(movie, movie_title)
+        dbpedia_details = all_movie_data[movie]
         for director in dbpedia_details["directors"]:
             if not my_complete_movie_list.is_cast_member_acknowledged(director):
                 acknowledged = ""
@@ -87,12 +91,12 @@ if search_term:
     chosen_dbpedia_uri = chosen_dbpedia_uri.replace(" ", "_")
     streamlit.write(chosen_dbpedia_uri)
     filmography_search_results = dbpedia_movie_util.find_movies_by_cast(chosen_dbpedia_uri, 'all')
-    thumbnail = filmography_search_results.get("thumbnail")
-    if "thumbnail" not in filmography_search_results:
-        filmography_search_results = dbpedia_movie_util.find_movies_by_cast(chosen_dbpedia_uri, 'all', ignore_cache=True)
-    thumbnail = filmography_search_results.get("thumbnail")
+    if filmography_search_results is None:
+        streamlit.error(f"Could not load the filmography for {chosen_dbpedia_uri} from dbpedia")
+        streamlit.stop()
+    thumbnail = dbpedia_movie_util.get_cast_thumbnail(chosen_dbpedia_uri, filmography_search_results)
     if thumbnail:
-        streamlit.image(thumbnail)
+        streamlit.image(thumbnail_store.image_for(thumbnail))
     filmography_film_set = set()
     filmography_film_set.update(filmography_search_results["actor"]["movies"])
     filmography_film_set.update(filmography_search_results["director"]["movies"])
@@ -152,17 +156,4 @@ if search_term:
 
 
 # While waiting, cache as many cast members as possible
-do_background = streamlit.checkbox("Cache filmographies in background")
-if do_background:
-    for movie in my_complete_movie_list.get_movies():
-        movie_title = movie.split("/")[-1]
-        dbpedia_details = dbpedia_movie_util.get_movie_data(movie, movie_title)
-        for director in dbpedia_details["directors"]:
-            filmography_cache_results = dbpedia_movie_util.find_movies_by_cast(director, 'all')
-            print(f"Cached {director}")
-        for writer in dbpedia_details["writers"]:
-            filmography_cache_results = dbpedia_movie_util.find_movies_by_cast(writer, 'all')
-            print(f"Cached {writer}")
-        for actor in dbpedia_details["actors"]:
-            filmography_cache_results = dbpedia_movie_util.find_movies_by_cast(actor, 'all')
-            print(f"Cached {actor}")
+prefetch_util.show_prefetch_panel(my_complete_movie_list)
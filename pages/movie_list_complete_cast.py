@@ -2,34 +2,26 @@
 
 import streamlit
 
+import cast_counts
 import dbpedia_movie_util
+import prefetch_util
+import thumbnail_store
 from unique_movie_list import MovieListComplete
 
 my_complete_movie_list = MovieListComplete("tom_zielund_complete_movies")
-my_complete_cast_film_count = dict()
-for movie in my_complete_movie_list.get_movies():
-    movie_title = movie.split("/")[-1]
-    dbpedia_details = dbpedia_movie_util.get_movie_data(movie, movie_title)
-    for director in dbpedia_details["directors"]:
-        if director not in my_complete_cast_film_count:
-            my_complete_cast_film_count[director] = 0
-        my_complete_cast_film_count[director] += 1
-    for writer in dbpedia_details["writers"]:
-        if writer not in my_complete_cast_film_count:
-            my_complete_cast_film_count[writer] = 0
-        my_complete_cast_film_count[writer] += 1
-    for actor in dbpedia_details["actors"]:
-        if actor not in my_complete_cast_film_count:
-            my_complete_cast_film_count[actor] = 0
-        my_complete_cast_film_count[actor] += 1
+# Counts saved with the list and kept current as movies are added and ignored below
+my_complete_cast_counts = cast_counts.attach(my_complete_movie_list, dbpedia_movie_util.get_movie_data_many,
+                                             dbpedia_movie_util.movies_edited_since)
 
 # sort cast by number of films
-sorted_cast = sorted(my_complete_cast_film_count.items(), key=lambda x: x[1], reverse=True)
+sorted_cast = my_complete_cast_counts.top()
 
 streamlit.sidebar.header(f"My Movie Cast ({len(my_complete_movie_list.get_movies())})")
+# One bulk lookup for every name in the sidebar
+cast_labels = dbpedia_movie_util.get_person_labels([cast_member for cast_member, _ in sorted_cast])
 default_cast_member = ""
 for cast_member, film_count in sorted_cast:
-    cast_link = dbpedia_movie_util.dbpedia_markdown_link(cast_member)
+    cast_link = dbpedia_movie_util.dbpedia_markdown_link(cast_member, cast_labels[cast_member])
     acknowledged = my_complete_movie_list.is_cast_member_acknowledged(cast_member)
     if acknowledged:
         cast_link += " (ack)"
@@ -40,8 +32,7 @@ for cast_member, film_count in sorted_cast:
 
 if default_cast_member:
     default_cast_member_uri = default_cast_member
-    default_cast_member = default_cast_member.replace("http://dbpedia.org/resource/", "")
-    default_cast_member = default_cast_member.replace("_", " ")
+    default_cast_member = cast_labels[default_cast_member]
 search_term = streamlit.text_input("Enter a contributor name", value=default_cast_member)
 if search_term:
     name_list = dbpedia_movie_util.search_for_person_in_wikipedia(search_term)
@@ -55,11 +46,12 @@ if search_term:
     chosen_dbpedia_uri = chosen_dbpedia_uri.replace(" ", "_")
     streamlit.write(chosen_dbpedia_uri)
     filmography_search_results = dbpedia_movie_util.find_movies_by_cast(chosen_dbpedia_uri, 'all')
-    if "thumbnail" not in filmography_search_results:
-        filmography_search_results = dbpedia_movie_util.find_movies_by_cast(chosen_dbpedia_uri, 'all', ignore_cache=True)
-    thumbnail = filmography_search_results.get("thumbnail")
+    if filmography_search_results is None:
+        streamlit.error(f"Could not load the filmography for {chosen_dbpedia_uri} from dbpedia")
+        streamlit.stop()
+    thumbnail = dbpedia_movie_util.get_cast_thumbnail(chosen_dbpedia_uri, filmography_search_results)
     if thumbnail:
-        streamlit.image(thumbnail)
+        streamlit.image(thumbnail_store.image_for(thumbnail))
     filmography_film_set = set()
     filmography_film_set.update(filmography_search_results["actor"]["movies"])
     filmography_film_set.update(filmography_search_results["director"]["movies"])
@@ -119,17 +111,4 @@ if search_term:
 
 
 # While waiting, cache as many cast members as possible
-do_background = streamlit.checkbox("Cache filmographies in background")
-if do_background:
-    for movie in my_complete_movie_list.get_movies():
-        movie_title = movie.split("/")[-1]
-        dbpedia_details = dbpedia_movie_util.get_movie_data(movie, movie_title)
-        for director in dbpedia_details["directors"]:
-            filmography_cache_results = dbpedia_movie_util.find_movies_by_cast(director, 'all')
-            print(f"Cached {director}")
-        for writer in dbpedia_details["writers"]:
-            filmography_cache_results = dbpedia_movie_util.find_movies_by_cast(writer, 'all')
-            print(f"Cached {writer}")
-        for actor in dbpedia_details["actors"]:
-            filmography_cache_results = dbpedia_movie_util.find_movies_by_cast(actor, 'all')
-            print(f"Cached {actor}")
+prefetch_util.show_prefetch_panel(my_complete_movie_list)
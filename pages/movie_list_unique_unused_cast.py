@@ -2,7 +2,9 @@
 
 import streamlit
 
+import cast_counts
 import dbpedia_movie_util
+import thumbnail_store
 from unique_movie_list import MovieList, MovieListComplete, Movie
 
 my_unique_movie_list = MovieList("tom_zielund_unique_movies")
@@ -13,29 +15,17 @@ show_unaddable_movies = streamlit.sidebar.checkbox("Show unaddable movies")
 show_unseen_movies = streamlit.sidebar.checkbox("Show unseen movies")
 check_ahead_if_options_are_available = streamlit.sidebar.checkbox("Check ahead if options are available")
 
-frequent_cast = dict()
-for movie in my_complete_movie_list.get_movies():
-    movie_title = movie.split("/")[-1]
-    dbpedia_details = dbpedia_movie_util.get_movie_data(movie, movie_title)
-    for director in dbpedia_details["directors"]:
-        if director not in frequent_cast:
-            frequent_cast[director] = 0
-        frequent_cast[director] += 1
-    for writer in dbpedia_details["writers"]:
-        if writer not in frequent_cast:
-            frequent_cast[writer] = 0
-        frequent_cast[writer] += 1
-    for actor in dbpedia_details["actors"]:
-        if actor not in frequent_cast:
-            frequent_cast[actor] = 0
-        frequent_cast[actor] += 1
-# Sort by frequency, desc)
-frequent_cast = sorted(frequent_cast.items(), key=lambda x: x[1], reverse=True)
+# Sort by frequency, desc
+frequent_cast = cast_counts.attach(my_complete_movie_list, dbpedia_movie_util.get_movie_data_many,
+                                   dbpedia_movie_util.movies_edited_since).top()
 
 covered_cast = dict()
+unique_movie_data = dbpedia_movie_util.get_movie_data_many(
+    {movie.uri: movie.title for movie in my_unique_movie_list.get_movies()})
 for movie in my_unique_movie_list.get_movies():
-    movie_title = movie.title
-    dbpedia_details = dbpedia_movie_util.get_movie_data(movie.uri, movie_title)
+    dbpedia_details = unique_movie_data.get(movie.uri)
+    if not dbpedia_details:
+        continue
     for director in dbpedia_details["directors"]:
         covered_cast[director] = movie
     for writer in dbpedia_details["writers"]:
@@ -43,6 +33,14 @@ for movie in my_unique_movie_list.get_movies():
     for actor in dbpedia_details["actors"]:
         covered_cast[actor] = movie
 
+if check_ahead_if_options_are_available:
+    # Download the thumbnails we already know about side by side, rather than one per row below
+    ahead_thumbnails = list()
+    for cast_member, _ in frequent_cast:
+        if cast_member not in covered_cast and dbpedia_movie_util.is_cast_cached(cast_member):
+            ahead_thumbnails.append(dbpedia_movie_util.find_movies_by_cast(cast_member, 'all').get("thumbnail"))
+    thumbnail_store.prefetch(ahead_thumbnails, wait=True)
+
 streamlit.title("Frequent Cast Members")
 for cast_member, film_count in frequent_cast:
     cast_link = dbpedia_movie_util.dbpedia_markdown_link(cast_member)
@@ -57,11 +55,14 @@ for cast_member, film_count in frequent_cast:
             # List out the filmography
             streamlit.write(f"**{cast_link}**")
             filmography_search_results = dbpedia_movie_util.find_movies_by_cast(cast_member, 'all')
-            if "thumbnail" not in filmography_search_results:
-                filmography_search_results = dbpedia_movie_util.find_movies_by_cast(cast_member, 'all', ignore_cache=True)
-            thumbnail = filmography_search_results.get("thumbnail")
+            if filmography_search_results is None:
+                streamlit.write("Could not load the filmography from dbpedia")
+                continue
+            thumbnail = dbpedia_movie_util.get_cast_thumbnail(cast_member, filmography_search_results)
             if thumbnail:
-                streamlit.image(thumbnail)
+                # The small variant when checking ahead, since that shows one per cast member
+                thumbnail_size = thumbnail_store.LARGE if look_closer else thumbnail_store.SMALL
+                streamlit.image(thumbnail_store.image_for(thumbnail, thumbnail_size))
             # streamlit.json(filmography_search_results)
             filmography_movie_set = set()
             for movie in filmography_search_results["director"]["movies"]:
@@ -2,7 +2,10 @@
 
 import streamlit
 
+import conflict_matrix
 import dbpedia_movie_util
+import swap_gain
+import unique_list_solver
 from unique_movie_list import MovieList, MovieListComplete, Movie
 
 my_unique_movie_list = MovieList("tom_zielund_unique_movies")
@@ -18,33 +21,37 @@ selected_cast = None
 selected_cast_role = None
 
 used_directors = my_unique_movie_list.get_used_directors()
+used_writers = my_unique_movie_list.get_used_writers()
+used_actors = my_unique_movie_list.get_used_actors()
+# One bulk lookup for every name the sidebar may show
+person_labels = dbpedia_movie_util.get_person_labels(list(used_directors) + list(used_writers) + list(used_actors))
+movie_titles = {movie.uri: movie.title for movie in sorted_movies}
+
 show_directors = streamlit.sidebar.checkbox(f"Used Directors ({len(used_directors)})")
 if show_directors:
     for director in used_directors:
-        director_link = dbpedia_movie_util.dbpedia_markdown_link(director)
-        d_movie_link = dbpedia_movie_util.dbpedia_markdown_link(used_directors[director])
+        director_link = dbpedia_movie_util.dbpedia_markdown_link(director, person_labels[director])
+        d_movie_link = dbpedia_movie_util.dbpedia_markdown_link(used_directors[director], movie_titles.get(used_directors[director]))
         director_check = streamlit.sidebar.checkbox(f"{director_link}: {d_movie_link}", disabled=selected_cast is not None)
         if director_check:
             selected_cast = director
             selected_cast_role = "director"
 
-used_writers = my_unique_movie_list.get_used_writers()
 show_writers = streamlit.sidebar.checkbox(f"Used Writers ({len(used_writers)})")
 if show_writers:
     for writer in used_writers:
-        writer_link = dbpedia_movie_util.dbpedia_markdown_link(writer)
-        w_movie_link = dbpedia_movie_util.dbpedia_markdown_link(used_writers[writer])
+        writer_link = dbpedia_movie_util.dbpedia_markdown_link(writer, person_labels[writer])
+        w_movie_link = dbpedia_movie_util.dbpedia_markdown_link(used_writers[writer], movie_titles.get(used_writers[writer]))
         writer_check = streamlit.sidebar.checkbox(f"{writer_link}: {w_movie_link}", disabled=selected_cast is not None)
         if writer_check:
             selected_cast = writer
             selected_cast_role = "writer"
 
-used_actors = my_unique_movie_list.get_used_actors()
 show_actors = streamlit.sidebar.checkbox(f"Used Actors ({len(used_actors)})")
 if show_actors:
     for actor in used_actors:
-        actor_link = dbpedia_movie_util.dbpedia_markdown_link(actor)
-        a_movie_link = dbpedia_movie_util.dbpedia_markdown_link(used_actors[actor])
+        actor_link = dbpedia_movie_util.dbpedia_markdown_link(actor, person_labels[actor])
+        a_movie_link = dbpedia_movie_util.dbpedia_markdown_link(used_actors[actor], movie_titles.get(used_actors[actor]))
         actor_check = streamlit.sidebar.checkbox(f"{actor_link}: {a_movie_link}", disabled=selected_cast is not None)
         if actor_check:
             selected_cast = actor
@@ -52,7 +59,7 @@ if show_actors:
 
 if selected_cast:
     # Search for movies with the selected cast member
-    streamlit.header(f"Movies with {selected_cast_role} {selected_cast}")
+    streamlit.header(f"Movies with {selected_cast_role} {person_labels[selected_cast]}")
     cast_movies = dbpedia_movie_util.find_movies_by_cast(selected_cast, selected_cast_role).get("movies", [])
     for movie in cast_movies:
         movie_link = dbpedia_movie_util.dbpedia_markdown_link(movie)
@@ -61,7 +68,7 @@ if selected_cast:
 
 streamlit.title("Search for a movie to add to your list")
 
-how_to_search = streamlit.selectbox("How to search", ["Pick from list", "Search by title"])
+how_to_search = streamlit.selectbox("How to search", ["Pick from list", "Search by title", "Suggest a list"])
 
 if how_to_search == "Search by title":
     streamlit.header("Search for a movie to add to your list")
@@ -106,6 +113,15 @@ if how_to_search == "Search by title":
                         credited_person_link = dbpedia_movie_util.dbpedia_markdown_link(reason[1])
                         credited_movie_link = dbpedia_movie_util.dbpedia_markdown_link(reason[2])
                         streamlit.write(f"{credit_type} {credited_person_link} already used in {credited_movie_link}")
+                    swap_matrix = conflict_matrix.get_conflict_matrix(
+                        my_unique_movie_list.list_title,
+                        dbpedia_movie_util.get_movie_data_many(my_complete_movie_list.get_movies()))
+                    swap_matrix.sync(my_unique_movie_list)
+                    swap = swap_gain.evaluate_swap(my_unique_movie_list, swap_matrix, dbpedia_details,
+                                                   my_complete_movie_list.ratings)
+                    streamlit.write(f"Replacing them nets {swap['size_delta']:+d} movies and {swap['rating_delta']:+g} "
+                                    f"rating, counting {len(swap['follow_ups'])} movies from your complete list "
+                                    f"it frees room for")
                     add_anyway = streamlit.button("Add anyway and replace these?")
                     if add_anyway:
                         my_unique_movie_list.add_movie_from_dict(dbpedia_details, replace_if_needed=True)
@@ -134,10 +150,56 @@ if how_to_search == "Search by title":
                             else:
                                 streamlit.stop()
 
+elif how_to_search == "Suggest a list":
+    streamlit.header("Suggest a list from your complete list")
+    objective = streamlit.selectbox("Maximize", [unique_list_solver.COUNT, unique_list_solver.RATING],
+                                    format_func={unique_list_solver.COUNT: "Number of movies",
+                                                 unique_list_solver.RATING: "Total rating"}.get)
+    keep_current = streamlit.checkbox("Keep the movies already in my list", value=True)
+    time_budget = streamlit.number_input("Seconds to search", min_value=1, max_value=60,
+                                         value=int(unique_list_solver.TIME_BUDGET))
+    movie_data = dbpedia_movie_util.get_movie_data_many(my_complete_movie_list.get_movies())
+    current_uris = my_unique_movie_list.get_movie_uri_list()
+    # The list's own copies, which are what its uniqueness checks go by
+    for movie in my_unique_movie_list.get_movies():
+        movie_data[movie.uri] = movie.to_dict()
+    forbidden = streamlit.multiselect("Never pick", sorted(movie_data),
+                                      format_func=lambda uri: movie_data[uri].get("title") or uri)
+    if streamlit.button("Find the best list"):
+        try:
+            streamlit.session_state["suggested_list"] = unique_list_solver.solve_complete_list(
+                my_complete_movie_list, movie_data, pinned=current_uris if keep_current else (),
+                forbidden=forbidden, objective=objective, time_budget=time_budget)
+        except ValueError as error:
+            streamlit.error(str(error))
+            streamlit.stop()
+    suggestion = streamlit.session_state.get("suggested_list")
+    if not suggestion:
+        streamlit.stop()
+    proven = "best possible" if suggestion["optimal"] else "best found in time"
+    streamlit.write(f"{suggestion['count']} movies, total rating {suggestion['rating']} "
+                    f"({proven}, {suggestion['seconds']:.1f}s)")
+    suggested_uris = set(suggestion["movies"])
+    to_add = [uri for uri in suggestion["movies"] if not my_unique_movie_list.has_movie_by_uri(uri)]
+    to_remove = [uri for uri in current_uris if uri not in suggested_uris]
+    streamlit.write(f"Adds {len(to_add)}, removes {len(to_remove)}")
+    for movie_uri in to_add:
+        streamlit.markdown(f"* + {dbpedia_movie_util.dbpedia_markdown_link(movie_uri, movie_data[movie_uri].get('title'))}")
+    for movie_uri in to_remove:
+        streamlit.markdown(f"* - {dbpedia_movie_util.dbpedia_markdown_link(movie_uri, movie_data[movie_uri].get('title'))}")
+    if (to_add or to_remove) and streamlit.button("Make this my list"):
+        for movie_uri in to_remove:
+            my_unique_movie_list.remove_movie_by_uri(movie_uri)
+        for movie_uri in to_add:
+            my_unique_movie_list.add_movie_from_dict(movie_data[movie_uri])
+        my_unique_movie_list.write()
+        del streamlit.session_state["suggested_list"]
+        streamlit.experimental_rerun()
+
 else:
     streamlit.header("Pick a movie from your complete list")
     complete_movie_set = set(my_complete_movie_list.movies.keys())
-    unique_movie_set = set(my_unique_movie_list.movies.keys())
+    unique_movie_set = set(my_unique_movie_list.get_movie_uri_list())
     complete_movie_minus_unique = complete_movie_set - unique_movie_set
     # sort the list by rating, descending
     complete_movie_minus_unique = sorted(complete_movie_minus_unique,
@@ -145,25 +207,60 @@ else:
     streamlit.write(f"Movies in your complete list that are not in your unique list: {len(complete_movie_minus_unique)}")
     show_impossible = streamlit.checkbox("Show movies that cannot be added")
     search_term = streamlit.text_input("Enter a movie title")
+    if search_term:
+        complete_movie_minus_unique = [movie_uri for movie_uri in complete_movie_minus_unique
+                                       if search_term.lower() in movie_uri.lower()]
+    # One matrix over the whole complete list, kept across reruns and synced
+    # with the unique list, says which candidates are addable in one pass
+    candidate_movie_data = dbpedia_movie_util.get_movie_data_many(my_complete_movie_list.get_movies())
+    candidate_matrix = conflict_matrix.get_conflict_matrix(my_unique_movie_list.list_title, candidate_movie_data)
+    candidate_matrix.sync(my_unique_movie_list)
+    complete_movie_minus_unique = [movie_uri for movie_uri in complete_movie_minus_unique
+                                   if movie_uri in candidate_movie_data]
+    addable_movies = set(candidate_matrix.addable(complete_movie_minus_unique))
+    swaps = dict()
+    if show_impossible:
+        # Blocked movies go after the addable ones, best swap first
+        ranked_swaps = swap_gain.rank_swaps(
+            my_unique_movie_list, candidate_matrix,
+            [candidate_movie_data[movie_uri] for movie_uri in complete_movie_minus_unique
+             if movie_uri not in addable_movies],
+            my_complete_movie_list.ratings)
+        swaps = {swap["movie"]: swap for swap in ranked_swaps}
+        complete_movie_minus_unique = ([movie_uri for movie_uri in complete_movie_minus_unique
+                                        if movie_uri in addable_movies] + list(swaps))
+    else:
+        complete_movie_minus_unique = [movie_uri for movie_uri in complete_movie_minus_unique
+                                       if movie_uri in addable_movies]
     for movie_uri in complete_movie_minus_unique:
-        if search_term and search_term.lower() not in movie_uri.lower():
-            continue
-        movie = dbpedia_movie_util.get_movie_data(movie_uri, movie_uri)
+        movie = candidate_movie_data[movie_uri]
         movie_link = dbpedia_movie_util.dbpedia_markdown_link(movie_uri)
-        reason_cannot_add = my_unique_movie_list.cannot_add_complete(movie)
+        reason_cannot_add = [] if movie_uri in addable_movies else candidate_matrix.blockers(movie_uri)
         if reason_cannot_add:
             if not show_impossible:
                 continue
-            add_it_anyway = streamlit.checkbox(f"{movie_link} (cannot add)")
+            swap = swaps[movie_uri]
+            add_it_anyway = streamlit.checkbox(f"{movie_link} (cannot add; swap nets {swap['size_delta']:+d} movies, "
+                                               f"rating {swap['rating_delta']:+g})")
             for (reason, person, film) in reason_cannot_add:
                 person_name = person.split("/")[-1]
                 film_name = film.split("/")[-1]
                 streamlit.write(f"--* {reason} {person_name} already used in {film_name}")
             # streamlit.write(f"* {movie_link} ({reason_cannot_add})")
             if add_it_anyway:
+                evicted_links = ", ".join(dbpedia_movie_util.dbpedia_markdown_link(film) for film in swap["evicted"])
+                streamlit.markdown(f"Replaces {evicted_links}")
+                if swap["follow_ups"]:
+                    follow_up_links = ", ".join(dbpedia_movie_util.dbpedia_markdown_link(film)
+                                                for film in swap["follow_ups"])
+                    streamlit.markdown(f"Then frees room for {follow_up_links}")
                 do_it = streamlit.button("Add anyway")
-                if do_it:
+                do_all = swap["follow_ups"] and streamlit.button("Add anyway, then the movies it frees room for")
+                if do_it or do_all:
                     my_unique_movie_list.add_movie_from_dict(movie, replace_if_needed=True)
+                    if do_all:
+                        for follow_up in swap["follow_ups"]:
+                            my_unique_movie_list.add_movie_from_dict(candidate_movie_data[follow_up])
                     my_unique_movie_list.write()
                     streamlit.experimental_rerun()
                 else:
@@ -171,7 +268,7 @@ else:
         else:
             add_it = streamlit.checkbox(f"* {movie_link} (available)")
             if add_it:
-                movie_data = dbpedia_movie_util.get_movie_data(movie_uri, movie_uri)
+                movie_data = movie
                 for director in movie_data["directors"]:
                     d_link = dbpedia_movie_util.dbpedia_markdown_link(director)
                     streamlit.markdown(f"* {d_link} (director)")
@@ -193,7 +290,7 @@ else:
                     my_complete_movie_list.write()
                     streamlit.experimental_rerun()
                 elif not_a_movie:
-                    my_complete_movie_list.ratings[movie_uri] = -1
+                    my_complete_movie_list.rate_movie(movie_uri, -1)
                     my_complete_movie_list.write()
                     streamlit.experimental_rerun()
                 else:
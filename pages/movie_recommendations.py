@@ -3,6 +3,7 @@
 import json
 import os
 import streamlit
+import cast_counts
 import unique_movie_list
 import dbpedia_movie_util
 
@@ -10,25 +11,12 @@ movie_list_unique = unique_movie_list.MovieList("tom_zielund_unique_movies")
 movie_list_complete = unique_movie_list.MovieListComplete("tom_zielund_complete_movies")
 
 # Get the list of cast members from the complete movie list
-complete_cast_film_count = dict()
-for movie in movie_list_complete.get_movies():
-    movie_title = movie.split("/")[-1]
-    dbpedia_details = dbpedia_movie_util.get_movie_data(movie, movie_title)
-    for director in dbpedia_details["directors"]:
-        if director not in complete_cast_film_count:
-            complete_cast_film_count[director] = 0
-        complete_cast_film_count[director] += 1
-    for writer in dbpedia_details["writers"]:
-        if writer not in complete_cast_film_count:
-            complete_cast_film_count[writer] = 0
-        complete_cast_film_count[writer] += 1
-    for actor in dbpedia_details["actors"]:
-        if actor not in complete_cast_film_count:
-            complete_cast_film_count[actor] = 0
-        complete_cast_film_count[actor] += 1
+complete_cast_counts = cast_counts.attach(movie_list_complete, dbpedia_movie_util.get_movie_data_many,
+                                          dbpedia_movie_util.movies_edited_since)
 
 # Sort cast by number of films
-sorted_cast = sorted(complete_cast_film_count.items(), key=lambda x: x[1], reverse=True)
+sorted_cast = complete_cast_counts.top()
+complete_cast_film_count = dict(sorted_cast)
 
 # # Now go thru the unseen movies and recommend based on the cast
 # unseen_movies = movie_list_complete.not_movies
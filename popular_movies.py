@@ -0,0 +1,181 @@
+# Columnar store over the popular-movies bulk pull, for ranking by gross.
+# The raw dbp:gross strings ("$1.2 billion", "US$45 million", "$45–50
+# million", "2.5E8") are parsed once into US dollars and kept as a numpy
+# column next to the uris and titles, so top-K, range filters and
+# percentiles over 100k+ films are array operations.  The columns are saved
+# alongside the checkpoint and rebuilt only when the checkpoint changes.
+
+import io
+import os
+import re
+import threading
+
+import numpy
+
+import dbpedia_bulk_pull
+import file_util
+
+COLUMNS_FILE = "dbpedia_movies.npz"
+
+_SCALES = {"billion": 1e9, "bn": 1e9, "b": 1e9, "million": 1e6, "mil": 1e6, "mn": 1e6, "m": 1e6,
+           "thousand": 1e3, "k": 1e3}
+# Currencies we can't turn into dollars without an exchange rate
+_FOREIGN = re.compile(r"£|€|¥|₹|₩|\b(?:gbp|eur|euro|euros|inr|rs|yen|jpy|cny|rmb|krw|dm|ff|lire|lira)\b"
+                      r"|(?<![a-z])(?:hk|a|au|ca|c|nz|nt|r|s)\$")
+# "$1.2 billion", "$1.2billion" or "$1.2-billion"
+_SCALE = r"(?:[\s-]*(billion|bn|million|mil|mn|thousand|[bmk])\b)?"
+_AMOUNT = re.compile(r"(\d+(?:\.\d+)?)" + _SCALE +
+                     r"(?:\s*(?:–|—|-|to)\s*(?:us)?\s*\$?\s*(\d+(?:\.\d+)?)" + _SCALE + ")?")
+
+
+def parse_gross(text: str):
+    """Return the gross in US dollars, or None if text isn't a dollar amount we can read.
+
+    Ranges give their midpoint; scale words apply to both ends of a range.
+    """
+    if not text:
+        return None
+    text = text.strip().lower().replace("\xa0", " ")
+    try:
+        # Typed numeric literals, e.g. 2.5E8
+        value = float(text)
+        return value if value > 0 else None
+    except ValueError:
+        pass
+    if _FOREIGN.search(text):
+        return None
+    # Thousands separators, but not decimal points
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", text)
+    match = _AMOUNT.search(text)
+    if not match:
+        return None
+    low, low_scale, high, high_scale = match.groups()
+    # "$45–50 million": the scale after the range covers both ends
+    value = float(low) * _SCALES.get(low_scale or high_scale, 1)
+    if high is not None:
+        value = (value + float(high) * _SCALES.get(high_scale or low_scale, 1)) / 2
+    return value if value > 0 else None
+
+
+def _pack(strings) -> tuple:
+    """Pack strings into one utf-8 byte column plus offsets."""
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8), offsets
+
+
+class MovieColumns:
+    """Uri, title, raw gross and gross-in-dollars columns, with rows ranked by gross."""
+
+    def __init__(self, gross, uri_data, uri_offsets, title_data, title_offsets, raw_data, raw_offsets):
+        self.gross = gross
+        self.uri_data = uri_data
+        self.uri_offsets = uri_offsets
+        self.title_data = title_data
+        self.title_offsets = title_offsets
+        self.raw_data = raw_data
+        self.raw_offsets = raw_offsets
+        # Row numbers from highest gross down; films without a parsed gross are left out
+        valid = numpy.flatnonzero(~numpy.isnan(gross))
+        self.ranked = valid[numpy.argsort(-gross[valid], kind="stable")]
+
+    def __len__(self):
+        return len(self.gross)
+
+    @classmethod
+    def from_records(cls, films):
+        gross = numpy.array([parse_gross(film["gross"]) for film in films], dtype=numpy.float64)
+        return cls(gross, *_pack(film["movie"] for film in films), *_pack(film["title"] for film in films),
+                   *_pack(film["gross"] for film in films))
+
+    @classmethod
+    def load(cls, path: str):
+        with numpy.load(path) as arrays:
+            return cls(*(arrays[name] for name in ("gross", "uri_data", "uri_offsets", "title_data",
+                                                   "title_offsets", "raw_data", "raw_offsets")))
+
+    def save(self, path: str, **extra) -> None:
+        out = io.BytesIO()
+        numpy.savez(out, gross=self.gross, uri_data=self.uri_data, uri_offsets=self.uri_offsets,
+                    title_data=self.title_data, title_offsets=self.title_offsets,
+                    raw_data=self.raw_data, raw_offsets=self.raw_offsets, **extra)
+        file_util.atomic_write(path, out.getvalue())
+
+    @staticmethod
+    def _string(data, offsets, row) -> str:
+        return data[offsets[row]:offsets[row + 1]].tobytes().decode("utf-8")
+
+    def row(self, row: int) -> dict:
+        gross = self.gross[row]
+        return {
+            "movie": self._string(self.uri_data, self.uri_offsets, row),
+            "title": self._string(self.title_data, self.title_offsets, row),
+            "gross": self._string(self.raw_data, self.raw_offsets, row),
+            "gross_usd": None if numpy.isnan(gross) else float(gross),
+        }
+
+    def rows(self, row_numbers) -> list:
+        return [self.row(row) for row in row_numbers]
+
+    def filter(self, min_gross: float = None, max_gross: float = None):
+        """Row numbers with a gross in [min_gross, max_gross], highest first."""
+        ranked = self.ranked
+        if min_gross is not None:
+            # ranked is in descending gross order, so each bound is one search
+            ranked = ranked[:numpy.searchsorted(-self.gross[ranked], -min_gross, side="right")]
+        if max_gross is not None:
+            ranked = ranked[numpy.searchsorted(-self.gross[ranked], -max_gross, side="left"):]
+        return ranked
+
+    def top_k(self, k: int, min_gross: float = None, max_gross: float = None) -> list:
+        return self.rows(self.filter(min_gross, max_gross)[:k])
+
+    def page(self, page_number: int, page_size: int, min_gross: float = None, max_gross: float = None) -> list:
+        start = page_number * page_size
+        return self.rows(self.filter(min_gross, max_gross)[start:start + page_size])
+
+    def count(self, min_gross: float = None, max_gross: float = None) -> int:
+        return len(self.filter(min_gross, max_gross))
+
+    def percentiles(self, percents) -> dict:
+        """Gross in dollars at each of the given percentiles, over films with a parsed gross."""
+        valid = self.gross[self.ranked]
+        if not len(valid):
+            return {percent: None for percent in percents}
+        values = numpy.percentile(valid, percents)
+        return {percent: float(value) for percent, value in zip(percents, values)}
+
+
+def _source_stamp(path: str) -> numpy.ndarray:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return numpy.array([0, 0], dtype=numpy.int64)
+    return numpy.array([stat.st_size, stat.st_mtime_ns], dtype=numpy.int64)
+
+
+_columns = None
+_columns_stamp = None
+_columns_lock = threading.Lock()
+
+
+def get_columns(source: str = dbpedia_bulk_pull.BULK_PULL_FILE, columns_file: str = COLUMNS_FILE) -> MovieColumns:
+    """Return the columns for the current checkpoint, from memory, the saved columns, or a fresh ingest."""
+    global _columns, _columns_stamp
+    stamp = _source_stamp(source)
+    with _columns_lock:
+        if _columns is not None and numpy.array_equal(stamp, _columns_stamp):
+            return _columns
+        columns = None
+        if os.path.exists(columns_file):
+            with numpy.load(columns_file) as arrays:
+                fresh = "source_stamp" in arrays and numpy.array_equal(arrays["source_stamp"], stamp)
+            if fresh:
+                columns = MovieColumns.load(columns_file)
+        if columns is None:
+            columns = MovieColumns.from_records(dbpedia_bulk_pull.load_movies(source))
+            columns.save(columns_file, source_stamp=stamp)
+        _columns = columns
+        _columns_stamp = stamp
+        return columns
@@ -0,0 +1,191 @@
+# Warm the dbpedia filmography and thumbnail caches in the background.
+# The prefetcher lives at process scope, so it keeps going across streamlit
+# reruns and after the browser tab that started it is closed.
+
+import queue
+import threading
+import time
+
+import streamlit
+
+import dbpedia_movie_util
+import http_util
+import thumbnail_store
+
+# The workers' requests go through dbpedia's adaptive limiter as background
+# work, so they run as fast as the endpoint allows and yield to page requests.
+PREFETCH_WORKERS = 8
+
+
+class FilmographyPrefetcher:
+    """Fetch find_movies_by_cast(person, 'all') for many people on a bounded pool of threads."""
+
+    def __init__(self, max_workers: int = PREFETCH_WORKERS):
+        self.max_workers = max_workers
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.seen = set()
+        self.workers = list()
+        self.stopped = threading.Event()
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started_at = None
+
+    def add_people(self, people) -> int:
+        """Queue people for prefetching, skipping duplicates.  People already cached
+        are only queued to have their thumbnails fetched, and aren't counted.
+
+        Returns the number of people newly queued for their filmographies.
+        """
+        queued = 0
+        cached = 0
+        with self.lock:
+            if self.done + self.failed == self.total:
+                # The last batch has drained; report on this one afresh
+                self.total = self.done = self.failed = self.skipped = 0
+                self.started_at = None
+            for person in people:
+                if person in self.seen:
+                    continue
+                self.seen.add(person)
+                if dbpedia_movie_util.is_cast_cached(person):
+                    # Their filmographies are in already; the workers make sure their thumbnails are too
+                    self.skipped += 1
+                    self.queue.put((person, True))
+                    cached += 1
+                    continue
+                self.queue.put((person, False))
+                self.total += 1
+                queued += 1
+            if queued or cached:
+                self.stopped.clear()
+                if queued and self.started_at is None:
+                    self.started_at = time.monotonic()
+                self._start_workers()
+        return queued
+
+    def _start_workers(self) -> None:
+        self.workers = [worker for worker in self.workers if worker.is_alive()]
+        while len(self.workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name="filmography-prefetch", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _work(self) -> None:
+        with http_util.background():
+            self._work_queue()
+
+    def _work_queue(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                person, cached = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                wrapper = dbpedia_movie_util.find_movies_by_cast(person, 'all')
+                if wrapper is None:
+                    raise RuntimeError("dbpedia query failed")
+                thumbnail_store.fetch(wrapper.get("thumbnail"))
+                if not cached:
+                    with self.lock:
+                        self.done += 1
+            except Exception as error:
+                print(f"Failed to prefetch {person}: {error}")
+                with self.lock:
+                    if not cached:
+                        self.failed += 1
+                    # Let a later add_people() call try this person again
+                    self.seen.discard(person)
+
+    def stop(self) -> None:
+        """Stop the workers and drop whatever is still queued."""
+        self.stopped.set()
+        with self.lock:
+            while True:
+                try:
+                    _, cached = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if not cached:
+                    self.total -= 1
+            self.seen.clear()
+
+    def is_running(self) -> bool:
+        """Return True while queued people are still being fetched."""
+        if self.stopped.is_set() or self.done + self.failed >= self.total:
+            return False
+        return any(worker.is_alive() for worker in self.workers)
+
+    def progress(self) -> dict:
+        """Return done/total counts, the fetch rate and an ETA in seconds."""
+        with self.lock:
+            finished = self.done + self.failed
+            elapsed = time.monotonic() - self.started_at if self.started_at else 0
+            rate = finished / elapsed if elapsed else 0
+            remaining = self.total - finished
+            return {
+                "done": self.done,
+                "failed": self.failed,
+                "total": self.total,
+                "skipped_cached": self.skipped,
+                "running": self.is_running(),
+                "per_second": rate,
+                "eta_seconds": remaining / rate if rate else None,
+            }
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_filmography_prefetcher() -> FilmographyPrefetcher:
+    """Return the process-wide prefetcher shared by every streamlit session."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = FilmographyPrefetcher()
+        return _prefetcher
+
+
+def show_prefetch_panel(movie_list) -> bool:
+    """Show the "Cache filmographies in background" panel for a MovieListComplete's cast,
+    with the dbpedia limiter's current rate and queues.
+
+    Returns True if the panel is open.
+    """
+    prefetcher = get_filmography_prefetcher()
+    if not streamlit.checkbox("Cache filmographies in background", value=prefetcher.is_running()):
+        return False
+    if not prefetcher.is_running() and streamlit.button("Start caching"):
+        all_movie_data = dbpedia_movie_util.get_movie_data_many(movie_list.get_movies())
+        prefetcher.add_people(movie_cast(all_movie_data.values()))
+    prefetch_progress = prefetcher.progress()
+    finished = prefetch_progress["done"] + prefetch_progress["failed"]
+    if prefetch_progress["total"]:
+        streamlit.progress(finished / prefetch_progress["total"])
+    eta = prefetch_progress["eta_seconds"]
+    eta_text = f", about {int(eta // 60)}m {int(eta % 60)}s left" if eta is not None else ""
+    streamlit.write(f"Cached {finished} of {prefetch_progress['total']} filmographies "
+                    f"({prefetch_progress['failed']} failed, {prefetch_progress['skipped_cached']} already cached{eta_text})")
+    for host, limits in http_util.limiter_metrics().items():
+        streamlit.caption(f"{host}: {limits['rate']:.1f} requests/s, {limits['in_flight']} of {limits['concurrency']} in flight, "
+                          f"{limits['queued_interactive']} page and {limits['queued_background']} background requests waiting")
+    if prefetcher.is_running():
+        if streamlit.button("Refresh progress"):
+            streamlit.rerun()
+        if streamlit.button("Stop caching"):
+            prefetcher.stop()
+            streamlit.rerun()
+    return True
+
+
+def movie_cast(movie_structs) -> list:
+    """Return every director, writer and actor across the given movie structs, in order."""
+    people = list()
+    for movie_struct in movie_structs:
+        people.extend(movie_struct["directors"])
+        people.extend(movie_struct["writers"])
+        people.extend(movie_struct["actors"])
+    return people
@@ -0,0 +1,137 @@
+# Adaptive rate limiting for the public dbpedia sparql endpoint.
+# Every request to a limited host takes a token from a token bucket and a
+# concurrency slot.  Both limits grow additively while responses come back
+# quickly and are cut in half when the endpoint throttles us (AIMD), so bulk
+# jobs settle at the fastest rate the endpoint tolerates.  Interactive
+# requests always go ahead of background ones waiting for the same host.
+
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# Starting point and bounds for the request rate (per second) and the number
+# of requests in flight at once.
+INITIAL_RATE = 4.0
+MIN_RATE = 0.5
+MAX_RATE = 20.0
+INITIAL_CONCURRENCY = 2.0
+MIN_CONCURRENCY = 1.0
+MAX_CONCURRENCY = 8.0
+
+# Responses slower than this (in seconds) stop the limits from growing.
+LATENCY_TARGET = 5.0
+# Status codes that mean the endpoint wants us to slow down.
+THROTTLE_STATUS_CODES = {429, 503}
+
+
+class AdaptiveLimiter:
+    """Token bucket plus an AIMD concurrency limit, with interactive requests ahead of background ones."""
+
+    def __init__(self, rate: float = INITIAL_RATE, concurrency: float = INITIAL_CONCURRENCY,
+                 min_rate: float = MIN_RATE, max_rate: float = MAX_RATE,
+                 min_concurrency: float = MIN_CONCURRENCY, max_concurrency: float = MAX_CONCURRENCY,
+                 latency_target: float = LATENCY_TARGET):
+        self.rate = rate
+        self.concurrency = concurrency
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.condition = threading.Condition()
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.waiting = {"interactive": 0, "background": 0}
+        self.completed = 0
+        self.throttled = 0
+        self.latency = None
+
+    def _refill(self, now: float) -> None:
+        burst = max(1.0, self.concurrency)
+        self.tokens = min(burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _wait_time(self, background: bool, now: float):
+        """Seconds until this caller may go, or None to wait for a notify."""
+        if background and self.waiting["interactive"]:
+            return None
+        if self.in_flight >= int(self.concurrency):
+            return None
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0
+
+    def acquire(self, background: bool = False) -> None:
+        """Block until a request may be sent.  Pair every acquire() with a release()."""
+        kind = "background" if background else "interactive"
+        with self.condition:
+            self.waiting[kind] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._wait_time(background, now)
+                    if wait == 0:
+                        break
+                    self.condition.wait(wait)
+                self.tokens -= 1
+                self.in_flight += 1
+            finally:
+                self.waiting[kind] -= 1
+                # Background callers may have been held back for this one
+                self.condition.notify_all()
+
+    def release(self, status_code=None, latency: float = None, retry_after: float = None) -> None:
+        """Report how the request went and adjust the limits.
+
+        status_code is None when the request failed to connect.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.completed += 1
+            if latency is not None:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if status_code in THROTTLE_STATUS_CODES or status_code is None:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            elif status_code < 500 and latency is not None and latency <= self.latency_target:
+                # Roughly one more slot per full window of healthy responses
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+                self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+            self.condition.notify_all()
+
+    def metrics(self) -> dict:
+        with self.condition:
+            return {
+                "rate": self.rate,
+                "concurrency": int(self.concurrency),
+                "in_flight": self.in_flight,
+                "queued_interactive": self.waiting["interactive"],
+                "queued_background": self.waiting["background"],
+                "paused_for": max(0.0, self.paused_until - time.monotonic()),
+                "latency": self.latency,
+                "completed": self.completed,
+                "throttled": self.throttled,
+            }
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (seconds or an http date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
@@ -0,0 +1,61 @@
+# Coalesce concurrent fetches of the same entity.
+# When several sessions miss the cache for the same key at once, only the
+# first one (the leader) does the fetch; the rest wait and share its result.
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """Run at most one fetch per key at a time; concurrent callers share its outcome."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = dict()
+
+    def begin(self, key):
+        """Claim key.  Returns (call, is_leader); only the leader should fetch, then call finish()."""
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                return call, False
+            call = self.calls[key] = _Call()
+            return call, True
+
+    def finish(self, key, call, result=None, error=None) -> None:
+        """Publish the leader's result (or error) to everyone waiting on key."""
+        with self.lock:
+            if self.calls.get(key) is call:
+                del self.calls[key]
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    def do(self, key, fetch, *args, **kwargs):
+        """Return fetch(*args, **kwargs), sharing one in-flight call per key."""
+        call, is_leader = self.begin(key)
+        if not is_leader:
+            return call.wait()
+        try:
+            result = fetch(*args, **kwargs)
+        except BaseException as error:
+            self.finish(key, call, error=error)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def in_flight(self) -> int:
+        with self.lock:
+            return len(self.calls)
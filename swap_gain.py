@@ -0,0 +1,71 @@
+# What-if analysis for adding a film to the unique list "anyway".
+# add_movie(..., replace_if_needed=True) evicts every film the new one
+# conflicts with.  Before doing that, evaluate_swap() works out which films
+# would go, the net change in size and rating, and which other complete-list
+# films the evictions would free up, so candidates can be ranked by what the
+# swap actually gains.  Everything is read off the live list index and the
+# conflict matrix; the list is never copied or modified.
+
+from symbol_table import symbols
+
+
+def _rating(ratings: dict, uri: str):
+    # -1 marks "not a movie", which counts as nothing
+    return max(ratings.get(uri, 0), 0)
+
+
+def evaluate_swap(unique_list, matrix, movie: dict, ratings: dict = None) -> dict:
+    """Evaluate adding movie (a movie struct) to unique_list with replacement.
+
+    matrix is the list's conflict_matrix.ConflictMatrix, already synced.
+    Returns {"movie", "evicted", "follow_ups", "size_delta", "rating_delta"}:
+    the uris evicted, a conflict-free chain of complete-list films that the
+    evictions make addable (best rated first), and the net change in list
+    size and total rating once the swap and the follow-ups are done.
+    """
+    ratings = ratings or dict()
+    uri = movie["uri"]
+    evicted = {film for _, _, film in unique_list.cannot_add_complete(movie)}
+    evicted_ids = {symbols.get(film) for film in evicted}
+    # People the evictions free, less the ones the new film takes
+    taken = matrix.columns_for(movie)
+    freed = set()
+    for film_id in evicted_ids:
+        freed |= matrix.columns_for(unique_list.movies[film_id])
+    freed -= taken
+    eligible = list()
+    for other in matrix.films_in(freed):
+        if other == uri or unique_list.has_movie_by_uri(other) or ratings.get(other, 0) < 0:
+            continue
+        blocking = matrix.blocking_films(other)
+        # Blocked only by films the swap evicts, and not by the new film itself
+        if blocking <= evicted_ids and not matrix.row_columns(other) & taken:
+            eligible.append(other)
+    eligible.sort(key=lambda other: (-_rating(ratings, other), len(matrix.row_columns(other)), other))
+    follow_ups = list()
+    for other in eligible:
+        columns = matrix.row_columns(other)
+        if not columns & taken:
+            follow_ups.append(other)
+            taken |= columns
+    return {
+        "movie": uri,
+        "evicted": sorted(evicted),
+        "follow_ups": follow_ups,
+        "size_delta": 1 - len(evicted) + len(follow_ups),
+        "rating_delta": (_rating(ratings, uri) - sum(_rating(ratings, film) for film in evicted)
+                         + sum(_rating(ratings, other) for other in follow_ups)),
+    }
+
+
+def rank_swaps(unique_list, matrix, movies, ratings: dict = None, by_rating: bool = False) -> list:
+    """evaluate_swap() for each movie struct in movies, best gain first.
+
+    Ranks by size change then rating change, or the other way round with by_rating.
+    """
+    swaps = [evaluate_swap(unique_list, matrix, movie, ratings) for movie in movies]
+    if by_rating:
+        swaps.sort(key=lambda swap: (swap["rating_delta"], swap["size_delta"]), reverse=True)
+    else:
+        swaps.sort(key=lambda swap: (swap["size_delta"], swap["rating_delta"]), reverse=True)
+    return swaps
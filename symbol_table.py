@@ -0,0 +1,225 @@
+# Process-wide table of interned dbpedia uris.
+# Each person or movie uri is stored once and handed out as a small int, so
+# the movie lists keep int arrays, int-keyed indexes and bitsets instead of
+# many copies of long "http://dbpedia.org/resource/..." strings.  The table
+# itself doesn't hold str objects either: the uris are utf-8 encoded back to
+# back in one bytearray, with the resource prefix cut to a single byte, and
+# found again through a sorted array of their hashes.  That is a few dozen
+# bytes a uri rather than well over a hundred.  Ids are only turned back into
+# uris for display and when a list is written to disk.
+
+import threading
+from array import array
+from bisect import bisect_left
+
+import numpy
+
+RESOURCE_PREFIX = "http://dbpedia.org/resource/"
+# Stands in for RESOURCE_PREFIX in the table; never part of a real uri
+_PREFIX_MARK = b"\x01"
+# Uris interned since the sorted index was last rebuilt wait in a plain
+# dict, until there are this many or an eighth of the table
+MERGE_AFTER = 1024
+# Batches at least this big are looked up with numpy in one go
+BULK_AFTER = 64
+
+
+def _key(uri: str) -> bytes:
+    if uri.startswith(RESOURCE_PREFIX):
+        return _PREFIX_MARK + uri[len(RESOURCE_PREFIX):].encode("utf-8")
+    return uri.encode("utf-8")
+
+
+def _decode(key) -> str:
+    if key[:1] == _PREFIX_MARK:
+        return RESOURCE_PREFIX + key[1:].decode("utf-8")
+    return key.decode("utf-8")
+
+
+class SymbolTable:
+    """Two-way map between uris and dense int ids.  Ids are never reused.
+
+    Lookups don't take the lock.  Everything about an id is stored before
+    the id is published, in recent or the index, so a reader never sees an
+    id it can't turn back into a uri.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Encoded uris back to back: id i is data[offsets[i]:offsets[i + 1]]
+        self.data = bytearray()
+        self.offsets = array("I", [0])
+        # hash() of each id's encoded uri
+        self.hashes = array("q")
+        # (sorted hashes, ids in the same order), replaced whole on rebuild
+        self.index = (array("q"), array("I"))
+        # uri -> id for ids not in the index yet
+        self.recent = dict()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _key_at(self, symbol: int):
+        return self.data[self.offsets[symbol]:self.offsets[symbol + 1]]
+
+    def _lookup(self, uri: str, key: bytes, key_hash: int):
+        symbol = self.recent.get(uri)
+        if symbol is not None:
+            return symbol
+        hashes, ids = self.index
+        position = bisect_left(hashes, key_hash)
+        while position < len(hashes) and hashes[position] == key_hash:
+            symbol = ids[position]
+            if self._key_at(symbol) == key:
+                return symbol
+            position += 1
+        return None
+
+    def _append(self, uri: str, key: bytes, key_hash: int) -> int:
+        # Under the lock
+        symbol = len(self.hashes)
+        self.data += key
+        self.offsets.append(len(self.data))
+        self.hashes.append(key_hash)
+        self.recent[uri] = symbol
+        return symbol
+
+    def _merge_recent(self) -> None:
+        # Under the lock.  Swap the index before emptying recent, so a
+        # reader checking recent then the index always finds the id in one
+        if len(self.recent) < max(MERGE_AFTER, len(self.hashes) // 8):
+            return
+        hashes = numpy.frombuffer(self.hashes.tobytes(), dtype=numpy.int64)
+        order = numpy.argsort(hashes, kind="stable")
+        sorted_hashes, ids = array("q"), array("I")
+        sorted_hashes.frombytes(hashes[order].tobytes())
+        ids.frombytes(order.astype(numpy.uint32).tobytes())
+        self.index = (sorted_hashes, ids)
+        self.recent = dict()
+
+    def intern(self, uri: str) -> int:
+        """Return the id for uri, assigning the next one if it is new."""
+        key = _key(uri)
+        key_hash = hash(key)
+        symbol = self._lookup(uri, key, key_hash)
+        if symbol is None:
+            with self.lock:
+                symbol = self._lookup(uri, key, key_hash)
+                if symbol is None:
+                    symbol = self._append(uri, key, key_hash)
+                    self._merge_recent()
+        return symbol
+
+    def _intern_all(self, uris) -> list:
+        uris = list(uris)
+        if len(uris) < BULK_AFTER:
+            return list(map(self.intern, uris))
+        # _key, inlined
+        keys = [_PREFIX_MARK + uri[len(RESOURCE_PREFIX):].encode("utf-8") if uri.startswith(RESOURCE_PREFIX)
+                else uri.encode("utf-8") for uri in uris]
+        key_hashes = [hash(key) for key in keys]
+        hashes, ids = self.index
+        if hashes:
+            # The index arrays are never changed once built, so views are safe
+            hashes = numpy.frombuffer(hashes, dtype=numpy.int64)
+            wanted = numpy.array(key_hashes, dtype=numpy.int64)
+            positions = numpy.minimum(hashes.searchsorted(wanted), len(hashes) - 1)
+            candidates = numpy.where(hashes[positions] == wanted,
+                                     numpy.frombuffer(ids, dtype=numpy.uint32)[positions].astype(numpy.int64),
+                                     -1).tolist()
+        else:
+            candidates = [-1] * len(uris)
+        found = list()
+        missing = list()
+        for position, (key, symbol) in enumerate(zip(keys, candidates)):
+            if symbol < 0 or self._key_at(symbol) != key:
+                # Not in the index, or another uri with the same hash
+                symbol = None
+                missing.append(position)
+            found.append(symbol)
+        if missing:
+            # Added under one lock, with one rebuild of the index after
+            with self.lock:
+                for position in missing:
+                    uri, key, key_hash = uris[position], keys[position], key_hashes[position]
+                    symbol = self._lookup(uri, key, key_hash)
+                    if symbol is None:
+                        symbol = self._append(uri, key, key_hash)
+                    found[position] = symbol
+                self._merge_recent()
+        return found
+
+    def intern_many(self, uris) -> array:
+        """Intern uris in bulk, as a compact array of ids."""
+        return array("I", self._intern_all(uris))
+
+    def intern_set(self, uris) -> "SymbolSet":
+        """Intern uris in bulk, as a SymbolSet of their ids."""
+        return SymbolSet(self._intern_all(uris))
+
+    def get(self, uri: str):
+        """Return the id for uri, or None if it was never interned.  Use this for lookups
+        so browsing candidates doesn't grow the table."""
+        key = _key(uri)
+        return self._lookup(uri, key, hash(key))
+
+    def uri(self, symbol: int) -> str:
+        return _decode(self._key_at(symbol))
+
+    def uris_for(self, symbols) -> list:
+        data = self.data
+        offsets = self.offsets
+        return [_decode(data[offsets[symbol]:offsets[symbol + 1]]) for symbol in symbols]
+
+
+class SymbolSet:
+    """A set of ids from the table, kept as a bitset: one bit per id, where a
+    set of ints costs dozens of bytes an id.  None is never a member, so
+    `symbols.get(uri) in a_set` works for uris never interned."""
+
+    __slots__ = ("bits", "count")
+
+    def __init__(self, ids=()):
+        ids = numpy.fromiter(ids, dtype=numpy.int64)
+        if len(ids):
+            flags = numpy.zeros(int(ids.max()) + 1, dtype=bool)
+            flags[ids] = True
+            self.bits = bytearray(numpy.packbits(flags, bitorder="little").tobytes())
+            self.count = int(flags.sum())
+        else:
+            self.bits = bytearray()
+            self.count = 0
+
+    def __contains__(self, symbol) -> bool:
+        if symbol is None or symbol >> 3 >= len(self.bits):
+            return False
+        return bool(self.bits[symbol >> 3] >> (symbol & 7) & 1)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        flags = numpy.unpackbits(numpy.frombuffer(bytes(self.bits), dtype=numpy.uint8), bitorder="little")
+        return iter(numpy.flatnonzero(flags).tolist())
+
+    def add(self, symbol: int) -> None:
+        if symbol in self:
+            return
+        if symbol >> 3 >= len(self.bits):
+            self.bits.extend(bytes((symbol >> 3) + 1 - len(self.bits)))
+        self.bits[symbol >> 3] |= 1 << (symbol & 7)
+        self.count += 1
+
+    def discard(self, symbol: int) -> None:
+        if symbol in self:
+            self.bits[symbol >> 3] &= ~(1 << (symbol & 7)) & 0xFF
+            self.count -= 1
+
+    def remove(self, symbol: int) -> None:
+        if symbol not in self:
+            raise KeyError(symbol)
+        self.discard(symbol)
+
+
+# Shared by every list in the process, so ids compare across lists
+symbols = SymbolTable()
@@ -0,0 +1,170 @@
+# Local cache of person thumbnails.
+# Each dbo:thumbnail image is downloaded once and kept on disk as small
+# resized jpegs, so the pages hand streamlit.image a local file instead of a
+# full-size remote image on every rerun.  The least recently used files are
+# evicted once the cache grows past MAX_CACHE_BYTES.
+
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import file_util
+import http_util
+import negative_cache
+import singleflight_util
+
+THUMBNAIL_CACHE_DIR = "thumbnail_cache"
+# Widths of the variants kept for each image
+SMALL = 64
+LARGE = 200
+SIZES = (SMALL, LARGE)
+MAX_CACHE_BYTES = 100 * 1024 * 1024
+# Evict down to this fraction of MAX_CACHE_BYTES, so we don't evict on every write
+EVICT_TO = 0.9
+PREFETCH_WORKERS = 4
+JPEG_QUALITY = 85
+# Wikimedia asks clients to identify themselves
+HEADERS = {"User-Agent": "movie_thing thumbnail cache"}
+
+_flights = singleflight_util.SingleFlight()
+_lock = threading.Lock()
+_cache_bytes = None
+_executor = None
+
+
+def _variant_path(url: str, size: int) -> str:
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return f"{THUMBNAIL_CACHE_DIR}/{key}_{size}.jpg"
+
+
+def _resize(data: bytes, size: int) -> bytes:
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((size, size * 4))
+    if image.mode != "RGB":
+        # Flatten transparency onto white; jpeg has no alpha
+        background = Image.new("RGB", image.size, "white")
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=JPEG_QUALITY)
+    return out.getvalue()
+
+
+def _total_bytes() -> int:
+    total = 0
+    for entry in os.scandir(THUMBNAIL_CACHE_DIR):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+def _note_written(size: int) -> None:
+    global _cache_bytes
+    with _lock:
+        if _cache_bytes is None:
+            _cache_bytes = _total_bytes()
+        else:
+            _cache_bytes += size
+        over = _cache_bytes > MAX_CACHE_BYTES
+    if over:
+        evict()
+
+
+def evict(max_bytes: int = None) -> int:
+    """Delete the least recently used files until the cache is under max_bytes.  Returns bytes freed."""
+    global _cache_bytes
+    target = int((max_bytes or MAX_CACHE_BYTES) * EVICT_TO)
+    with _lock:
+        entries = [entry for entry in os.scandir(THUMBNAIL_CACHE_DIR) if entry.is_file()]
+        stats = sorted(((entry.stat(), entry.path) for entry in entries), key=lambda item: item[0].st_mtime)
+        total = sum(stat.st_size for stat, _ in stats)
+        freed = 0
+        for stat, path in stats:
+            if total - freed <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            freed += stat.st_size
+        _cache_bytes = total - freed
+    return freed
+
+
+def _download(url: str) -> bool:
+    """Fetch the image and write every resized variant.  Returns True on success."""
+    if all(os.path.exists(_variant_path(url, size)) for size in SIZES):
+        return True
+    response = http_util.get(url, headers=HEADERS)
+    if response is None or response.status_code != 200:
+        negative_cache.remember("thumbnail_image", url, negative_cache.reason_for_response(response))
+        return False
+    try:
+        variants = {size: _resize(response.content, size) for size in SIZES}
+    except (OSError, ValueError) as error:
+        print(f"Could not resize thumbnail {url}: {error}")
+        negative_cache.remember("thumbnail_image", url, negative_cache.NOT_FOUND)
+        return False
+    os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+    for size, data in variants.items():
+        file_util.atomic_write(_variant_path(url, size), data)
+    _note_written(sum(len(data) for data in variants.values()))
+    return True
+
+
+def fetch(url: str) -> bool:
+    """Make sure the resized variants of url are on disk.  Returns False if they can't be had."""
+    if not url:
+        return False
+    if all(os.path.exists(_variant_path(url, size)) for size in SIZES):
+        return True
+    if negative_cache.check("thumbnail_image", url):
+        return False
+    return _flights.do(url, _download, url)
+
+
+def local_image(url: str, size: int = LARGE):
+    """Return the path of the cached size variant of url, downloading it first if needed.
+
+    Returns None if the image couldn't be downloaded or read.
+    """
+    if not fetch(url):
+        return None
+    path = _variant_path(url, size)
+    try:
+        # Mark it recently used for eviction
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+
+def image_for(url: str, size: int = LARGE):
+    """What to hand streamlit.image: the local variant, or the remote url if it couldn't be cached."""
+    return local_image(url, size) or url
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="thumbnail-prefetch")
+        return _executor
+
+
+def _fetch_in_background(url: str) -> bool:
+    with http_util.background():
+        return fetch(url)
+
+
+def prefetch(urls, wait: bool = False) -> None:
+    """Download the given thumbnails concurrently.  With wait, return once they are all done."""
+    futures = [_get_executor().submit(_fetch_in_background, url) for url in dict.fromkeys(urls) if url]
+    if wait:
+        for future in futures:
+            future.exception()
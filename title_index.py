@@ -0,0 +1,211 @@
+# Local in-memory search index over film titles.
+# Answers prefix, substring and ranked fuzzy title searches without a
+# server-side full scan on dbpedia.  Built once per process from the titles
+# we already know about (cached movies, remembered search results, the
+# popular-movies bulk pull and the offline store when present).
+
+import bisect
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+import dbpedia_bulk_pull
+import dbpedia_local
+import dbpedia_store
+
+FUZZY_THRESHOLD = 0.25
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+# A trailing "(1995 film)" style disambiguation
+_QUALIFIER = re.compile(r"\s*\([^()]*\)\s*$")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and collapse punctuation and underscores to single spaces."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def trigrams(normalized: str) -> set:
+    """Trigrams of the text padded at the ends, so word starts count for more."""
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def inner_trigrams(normalized: str) -> set:
+    """Trigrams of the text itself, which any title containing it must share."""
+    return {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+
+
+def title_from_uri(uri: str) -> str:
+    return uri.split("/")[-1].replace("_", " ")
+
+
+class TitleIndex:
+    """Token, prefix and trigram index over (uri, title) pairs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.uris = list()
+        self.titles = list()
+        self.normalized = list()
+        self.trigram_counts = list()
+        self.ids_by_uri = dict()
+        self.token_postings = dict()
+        self.trigram_postings = dict()
+        # Sorted lazily, on the first prefix search after new tokens arrive
+        self.sorted_tokens = list()
+        self.tokens_dirty = False
+
+    def __len__(self):
+        return len(self.uris)
+
+    def add(self, uri: str, title: str = None) -> None:
+        """Add a film to the index.  Titles that are really uris are turned back into words."""
+        if not title or title == uri or title.startswith("http"):
+            title = title_from_uri(uri)
+        with self.lock:
+            if uri in self.ids_by_uri:
+                return
+            normalized = normalize(title)
+            entry_id = len(self.uris)
+            self.uris.append(uri)
+            self.titles.append(title)
+            self.normalized.append(normalized)
+            self.ids_by_uri[uri] = entry_id
+            for token in set(normalized.split()):
+                postings = self.token_postings.get(token)
+                if postings is None:
+                    postings = self.token_postings[token] = list()
+                    self.sorted_tokens.append(token)
+                    self.tokens_dirty = True
+                postings.append(entry_id)
+            title_trigrams = trigrams(normalized)
+            self.trigram_counts.append(len(title_trigrams))
+            for trigram in title_trigrams:
+                self.trigram_postings.setdefault(trigram, list()).append(entry_id)
+
+    def add_many(self, pairs) -> None:
+        for uri, title in pairs:
+            self.add(uri, title)
+
+    def _prefix_ids(self, prefix: str) -> set:
+        if self.tokens_dirty:
+            self.sorted_tokens.sort()
+            self.tokens_dirty = False
+        ids = set()
+        start = bisect.bisect_left(self.sorted_tokens, prefix)
+        for token in self.sorted_tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            ids.update(self.token_postings[token])
+        return ids
+
+    def _substring_ids(self, query: str) -> set:
+        if len(query) < 3:
+            # Too short for trigrams; fall back to token prefixes
+            return self._prefix_ids(query)
+        postings = sorted((self.trigram_postings.get(trigram, []) for trigram in inner_trigrams(query)),
+                          key=len)
+        if not postings[0]:
+            return set()
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return {entry_id for entry_id in candidates if query in self.normalized[entry_id]}
+
+    def _fuzzy_scores(self, query: str) -> dict:
+        query_trigrams = trigrams(query)
+        overlap = Counter()
+        for trigram in query_trigrams:
+            overlap.update(self.trigram_postings.get(trigram, ()))
+        scores = dict()
+        for entry_id, shared in overlap.items():
+            total = len(query_trigrams) + self.trigram_counts[entry_id] - shared
+            score = shared / total
+            if score >= FUZZY_THRESHOLD:
+                scores[entry_id] = score
+        return scores
+
+    def _is_exact(self, entry_id: int, query: str) -> bool:
+        """The title is the query, once normalized and ignoring a trailing
+        disambiguation like "(1995 film)"."""
+        return self.normalized[entry_id] == query or normalize(_QUALIFIER.sub("", self.titles[entry_id])) == query
+
+    def has_title(self, text: str) -> bool:
+        """True if some film's title is exactly text, in the sense of search()'s exact matches."""
+        query = normalize(text)
+        if not query:
+            return False
+        with self.lock:
+            return any(self._is_exact(entry_id, query) for entry_id in self._substring_ids(query))
+
+    def search(self, text: str, limit: int = 50, fuzzy: bool = True) -> list:
+        """Return up to limit (uri, title) pairs, best matches first.
+
+        Exact titles (ignoring a "(1995 film)" style suffix) rank first, then titles starting with the query, then titles
+        containing it, then titles whose words start with every query word, then
+        fuzzy (trigram similarity) matches.
+        """
+        query = normalize(text)
+        if not query:
+            return list()
+        with self.lock:
+            ranked = dict()
+            for entry_id in self._substring_ids(query):
+                title = self.normalized[entry_id]
+                if self._is_exact(entry_id, query):
+                    rank = 0
+                elif title.startswith(query):
+                    rank = 1
+                else:
+                    rank = 2
+                ranked[entry_id] = (rank, len(title))
+            words = query.split()
+            if len(words) > 1:
+                word_ids = None
+                for word in words:
+                    ids = self._prefix_ids(word)
+                    word_ids = ids if word_ids is None else word_ids & ids
+                for entry_id in word_ids or ():
+                    ranked.setdefault(entry_id, (3, len(self.normalized[entry_id])))
+            if fuzzy and len(ranked) < limit:
+                for entry_id, score in self._fuzzy_scores(query).items():
+                    ranked.setdefault(entry_id, (4, -score))
+            best = sorted(ranked.items(), key=lambda item: item[1])[:limit]
+            return [(self.uris[entry_id], self.titles[entry_id]) for entry_id, _ in best]
+
+
+def _bulk_pull_titles():
+    """Titles from the most popular movies bulk pull."""
+    for film in dbpedia_bulk_pull.load_movies():
+        yield film["movie"], film["title"]
+
+
+def build_index() -> TitleIndex:
+    """Build an index from every film title available locally."""
+    index = TitleIndex()
+    index.add_many(dbpedia_store.get_titles())
+    index.add_many(dbpedia_store.get_movie_titles())
+    index.add_many(_bulk_pull_titles())
+    if dbpedia_local.is_available():
+        index.add_many(dbpedia_local.connect().execute("SELECT uri, label FROM films"))
+    print(f"Built title index over {len(index)} films")
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_title_index() -> TitleIndex:
+    """Return the process-wide title index, building it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = build_index()
+        return _index
@@ -2,7 +2,11 @@
 
 import json
 import os
-import requests
+
+import cache_format
+import http_util
+import negative_cache
+import singleflight_util
 
 TMDB_CACHE = "tmdb_cache"
 os.makedirs(TMDB_CACHE, exist_ok=True)
@@ -14,41 +18,61 @@ if not TMDB_API_KEY:
         config = json.load(IN)
         TMDB_API_KEY = config["TMDB_API_KEY"]
 
+# Concurrent sessions asking for the same uncached movie share one API call
+_flights = singleflight_util.SingleFlight()
+
 def get_cached_movie_details(movie_id):
     """Get the movie details from the TMDB API, caching the results."""
     cache_file = f"{TMDB_CACHE}/movie_{movie_id}.json"
     if os.path.exists(cache_file):
-        with open(cache_file) as IN:
-            return json.load(IN)
+        return cache_format.read(cache_file)
+    if negative_cache.check("tmdb_movie", str(movie_id)):
+        return None
     # Otherwise call the API and cache the results
+    return _flights.do(str(movie_id), _fetch_movie_details, movie_id, cache_file)
+
+def _fetch_movie_details(movie_id, cache_file):
+    if os.path.exists(cache_file):
+        # Written by another session while we were checking
+        return cache_format.read(cache_file)
     url = f"https://api.themoviedb.org/3/movie/{movie_id}?api_key={TMDB_API_KEY}"
-    result = requests.get(url)
-    if result.status_code != 200:
+    result = http_util.get(url)
+    if result is None or result.status_code != 200:
+        negative_cache.remember("tmdb_movie", str(movie_id), negative_cache.reason_for_response(result))
         return None
     movie = result.json()
     # Add the credits details from the API
     credits_url = f"https://api.themoviedb.org/3/movie/{movie_id}/credits?api_key={TMDB_API_KEY}"
-    credits_result = requests.get(credits_url)
-    if credits_result.status_code == 200:
+    credits_result = http_util.get(credits_url)
+    if credits_result is not None and credits_result.status_code == 200:
         movie["credits"] = credits_result.json()
-    with open(cache_file, "w") as OUT:
-        OUT.write(json.dumps(movie, indent=2))
+    cache_format.write(cache_file, movie)
     return movie
 
 def set_top_cast_and_crew(movie_id, top_cast_and_crew_dict0):
     """Add the top cast and crew to the movie details."""
     credits_url = f"https://api.themoviedb.org/3/movie/{movie_id}/credits?api_key={TMDB_API_KEY}"
-    credits_result = requests.get(credits_url)
-    if credits_result.status_code == 200:
+    credits_result = http_util.get(credits_url)
+    if credits_result is not None and credits_result.status_code == 200:
         movie_details["credits"] = credits_result.json()
     return movie_details
 
 def search_for_movie(search_term):
     """Search for a movie by title using the TMDB API."""
+    reason = negative_cache.check("tmdb_search", search_term)
+    if reason:
+        return {"page": 1, "results": [], "total_pages": 0, "total_results": 0} if reason == negative_cache.NOT_FOUND else None
     search_url = f"https://api.themoviedb.org/3/search/movie?api_key={TMDB_API_KEY}&query={search_term}"
-    response = requests.get(search_url)
+    response = http_util.get(search_url)
+    if response is None:
+        negative_cache.remember("tmdb_search", search_term, negative_cache.SERVER_ERROR)
+        return None
     if response.status_code != 200:
         print(f"Error: {response.status_code}")
         print(response.text)
+        negative_cache.remember("tmdb_search", search_term, negative_cache.reason_for_response(response))
         return None
-    return response.json()
\ No newline at end of file
+    results = response.json()
+    if not results.get("results"):
+        negative_cache.remember("tmdb_search", search_term, negative_cache.NOT_FOUND)
+    return results
\ No newline at end of file
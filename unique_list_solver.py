@@ -0,0 +1,292 @@
+# Solver for the unique movie list.
+# Picks the best list of films from the complete list in which no director,
+# writer or actor repeats in the same role, as MovieList requires: a weighted
+# maximum set packing.  Films that share a person can never both be picked,
+# so the films split into independent components; each is solved on its own
+# with the films' conflicts kept as int bitsets, so checking a film against
+# the films picked so far is one AND.
+#
+# Each component gets greedy seeding and local search with swaps, which
+# usually settles well inside the budget; whatever time is left goes to
+# (optional) branch and bound, smallest components first.  When time runs
+# out the best list found so far is returned.
+
+import random
+import time
+
+from unique_movie_list import ROLE_KEYS, ROLES
+
+COUNT = "count"
+RATING = "rating"
+OBJECTIVES = (COUNT, RATING)
+TIME_BUDGET = 5.0
+# Components bigger than this are left to local search; branch and bound
+# would not finish them in any reasonable budget
+EXACT_COMPONENT_LIMIT = 2000
+
+
+try:
+    # Python 3.10+
+    _popcount = int.bit_count
+except AttributeError:
+    def _popcount(bits: int) -> int:
+        return bin(bits).count("1")
+
+
+def _members(bits: int):
+    """Yield the index of each set bit."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def _total(bits: int, weights) -> int:
+    return sum(weights[index] for index in _members(bits))
+
+
+def _people(movie: dict) -> set:
+    return {(role, person) for role, key in zip(ROLES, ROLE_KEYS) for person in movie.get(key) or ()}
+
+
+def _greedy(masks, weights) -> int:
+    """Pick films by weight per conflict, skipping any that clash with those already picked."""
+    order = sorted(range(len(masks)), key=lambda index: weights[index] / (1 + _popcount(masks[index])), reverse=True)
+    chosen = blocked = 0
+    for index in order:
+        if not blocked >> index & 1:
+            chosen |= 1 << index
+            blocked |= masks[index]
+    return chosen
+
+
+def _local_search(masks, weights, chosen: int, deadline: float, rng) -> int:
+    """Improve chosen with swaps until none helps or time runs out.
+
+    A film goes in if it outweighs the picked films it conflicts with, and a
+    picked film is traded for two non-conflicting films that only it blocks.
+    """
+    indexes = list(range(len(masks)))
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        rng.shuffle(indexes)
+        blocked_by_one = dict()
+        for position, index in enumerate(indexes):
+            if not position % 1024 and time.monotonic() > deadline:
+                return chosen
+            if chosen >> index & 1:
+                continue
+            blockers = masks[index] & chosen
+            if weights[index] > _total(blockers, weights):
+                chosen = (chosen & ~blockers) | (1 << index)
+                improved = True
+            elif not blockers & (blockers - 1):
+                blocked_by_one.setdefault(blockers, list()).append(index)
+        if improved:
+            continue
+        for blocker, outside in blocked_by_one.items():
+            blocker_weight = weights[blocker.bit_length() - 1]
+            outside.sort(key=weights.__getitem__, reverse=True)
+            swap = None
+            for position, first in enumerate(outside):
+                for second in outside[position + 1:]:
+                    if weights[first] + weights[second] <= blocker_weight:
+                        break
+                    if not masks[first] >> second & 1:
+                        swap = first, second
+                        break
+                if swap:
+                    break
+            # Earlier swaps may have changed what blocks these two
+            if swap and all(masks[index] & chosen == blocker for index in swap):
+                chosen = (chosen & ~blocker) | (1 << swap[0]) | (1 << swap[1])
+                improved = True
+    return chosen
+
+
+def _clique_cover_bound(candidates: int, masks, weights) -> int:
+    """Upper bound on what candidates can add: cover them with groups of mutually
+    conflicting films, at most one of which can be picked from each."""
+    bound = 0
+    while candidates:
+        low = candidates & -candidates
+        index = low.bit_length() - 1
+        clique = low
+        best = weights[index]
+        common = candidates & masks[index]
+        while common:
+            low = common & -common
+            member = low.bit_length() - 1
+            clique |= low
+            best = max(best, weights[member])
+            common &= masks[member]
+        bound += best
+        candidates &= ~clique
+    return bound
+
+
+def _branch_and_bound(masks, weights, incumbent: int, deadline: float) -> tuple:
+    """Search for the best packing, starting from incumbent.  Returns (chosen, proven optimal)."""
+    everything = (1 << len(masks)) - 1
+    best_weight = _total(incumbent, weights)
+    best = incumbent
+    if _clique_cover_bound(everything, masks, weights) <= best_weight:
+        return best, True
+    # Depth first, explicitly stacked: (chosen, weight, candidates)
+    stack = [(0, 0, everything)]
+    while stack:
+        if time.monotonic() > deadline:
+            return best, False
+        chosen, weight, candidates = stack.pop()
+        # Films that clash with no other candidate are always worth taking
+        free = 0
+        for index in _members(candidates):
+            if not masks[index] & candidates:
+                free |= 1 << index
+        if free:
+            chosen |= free
+            weight += _total(free, weights)
+            candidates &= ~free
+        if not candidates:
+            if weight > best_weight:
+                best_weight, best = weight, chosen
+            continue
+        if weight + _clique_cover_bound(candidates, masks, weights) <= best_weight:
+            continue
+        # Branch on the candidate with the most conflicts among the candidates
+        pivot = max(_members(candidates), key=lambda index: _popcount(masks[index] & candidates))
+        bit = 1 << pivot
+        stack.append((chosen, weight, candidates & ~bit))
+        stack.append((chosen | bit, weight + weights[pivot], candidates & ~bit & ~masks[pivot]))
+    return best, True
+
+
+def _components(films: list, movies: dict) -> list:
+    """Split films into groups that share no person with each other.  Returns
+    each group with its films' conflict bitsets over the group's own numbering."""
+    parent = list(range(len(films)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    shared = dict()
+    for index, uri in enumerate(films):
+        for person in _people(movies[uri]):
+            shared.setdefault(person, list()).append(index)
+    groups = [indexes for indexes in shared.values() if len(indexes) > 1]
+    for indexes in groups:
+        root = find(indexes[0])
+        for index in indexes[1:]:
+            other = find(index)
+            if other != root:
+                parent[other] = root
+    members = dict()
+    for index in range(len(films)):
+        members.setdefault(find(index), list()).append(index)
+    local = dict()
+    for component in members.values():
+        for position, index in enumerate(component):
+            local[index] = position
+    masks = [0] * len(films)
+    for indexes in groups:
+        clique = 0
+        for index in indexes:
+            clique |= 1 << local[index]
+        for index in indexes:
+            masks[index] |= clique
+    components = list()
+    for component in members.values():
+        component_masks = [masks[index] & ~(1 << local[index]) for index in component]
+        components.append(([films[index] for index in component], component_masks))
+    return components
+
+
+def solve(movies: dict, ratings: dict = None, pinned=(), forbidden=(), objective: str = COUNT,
+          time_budget: float = TIME_BUDGET, exact: bool = True, seed: int = 0) -> dict:
+    """Find a conflict-free list of films.
+
+    movies maps each candidate uri to its movie struct (directors, writers,
+    actors).  The count objective maximizes how many films are picked; the
+    rating objective maximizes the sum of ratings, then the count.  Pinned
+    films are always picked and forbidden ones never are; films rated below 0
+    ("not a movie") are left out.  Raises ValueError if pinned films conflict.
+
+    Returns {"movies": [uri, ...], "count", "rating", "optimal", "seconds"};
+    optimal is True when branch and bound proved the list can't be beaten.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}, not {objective!r}")
+    started = time.monotonic()
+    ratings = ratings or dict()
+    forbidden = set(forbidden)
+    pinned = [uri for uri in dict.fromkeys(pinned) if uri in movies]
+    pinned_people = dict()
+    for uri in pinned:
+        for person in _people(movies[uri]):
+            if person in pinned_people:
+                raise ValueError(f"Pinned films {pinned_people[person]} and {uri} share {person[0]} {person[1]}")
+            pinned_people[person] = uri
+    pinned_set = set(pinned)
+    films = [uri for uri in movies
+             if uri not in pinned_set and uri not in forbidden and ratings.get(uri, 0) >= 0
+             and pinned_people.keys().isdisjoint(_people(movies[uri]))]
+    if objective == RATING:
+        # Integer weights: any extra rating point beats any number of extra films
+        scale = len(films) + 1
+        weight_of = {uri: ratings.get(uri, 0) * scale + 1 for uri in films}
+    else:
+        weight_of = dict.fromkeys(films, 1)
+
+    components = _components(films, movies)
+    # Small components first, so the cheap ones are settled before time runs short
+    components.sort(key=lambda component: len(component[0]))
+    rng = random.Random(seed)
+    deadline = started + time_budget
+    solutions = list()
+    for uris, masks in components:
+        weights = [weight_of[uri] for uri in uris]
+        if len(uris) == 1:
+            solutions.append([uris, masks, weights, 1, True])
+            continue
+        chosen = _local_search(masks, weights, _greedy(masks, weights), deadline, rng)
+        solutions.append([uris, masks, weights, chosen, False])
+    optimal = exact
+    if exact:
+        for solution in solutions:
+            uris, masks, weights, chosen, solved = solution
+            if solved:
+                continue
+            if len(uris) > EXACT_COMPONENT_LIMIT or time.monotonic() > deadline:
+                optimal = False
+                break
+            solution[3], solution[4] = _branch_and_bound(masks, weights, chosen, deadline)
+            optimal = optimal and solution[4]
+
+    picked = list(pinned)
+    for uris, _, _, chosen, _ in solutions:
+        picked.extend(uris[index] for index in _members(chosen))
+    return {
+        "movies": picked,
+        "count": len(picked),
+        "rating": sum(max(ratings.get(uri, 0), 0) for uri in picked),
+        "optimal": optimal,
+        "seconds": time.monotonic() - started,
+    }
+
+
+def solve_complete_list(complete_list, movie_data: dict, **options) -> dict:
+    """solve() over a MovieListComplete's films and ratings.
+
+    movie_data maps uris to movie structs, as from
+    dbpedia_movie_util.get_movie_data_many(complete_list.get_movies()); films
+    missing from it are skipped.  Pinned films need to be in movie_data too.
+    """
+    movies = {uri: movie_data[uri] for uri in complete_list.get_movies() if uri in movie_data}
+    for uri in options.get("pinned", ()):
+        if uri in movie_data:
+            movies[uri] = movie_data[uri]
+    return solve(movies, complete_list.ratings, **options)
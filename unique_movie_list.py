@@ -1,8 +1,10 @@
 # Manage a unique movie list
 # THis is a list of movies in which no actor, director, or writer appears more than once.
-import json
 import os
-from typing import List, Union
+from typing import List, Tuple, Union
+
+import list_journal
+from symbol_table import SymbolSet, symbols
 
 # The list is managed by the MovieList class, which has the following methods:
 # - add_movie(movie: Movie) -> None: Adds a movie to the list.
@@ -29,70 +31,218 @@ MOVIE_LIST_CACHE_DIR = "movie_list_cache/"
 os.makedirs(MOVIE_LIST_CACHE_DIR, exist_ok=True)
 
 class Movie:
+    """A movie with its people held as interned ids; see symbol_table."""
+
+    __slots__ = ("uri_id", "title", "director_ids", "writer_ids", "actor_ids", "people_uris")
 
     def __init__(self, metadata):
-        self.uri = metadata["uri"]
+        self.uri_id = symbols.intern(metadata["uri"])
         self.title = metadata["title"]
-        self.directors = metadata["directors"]
-        self.writers = metadata["writers"]
-        self.actors = metadata["actors"]
-
-class MovieListComplete:
+        self.director_ids = symbols.intern_many(metadata["directors"])
+        self.writer_ids = symbols.intern_many(metadata["writers"])
+        self.actor_ids = symbols.intern_many(metadata["actors"])
+        # (directors, writers, actors) as uris, decoded on first use and kept,
+        # since pages read them in loops
+        self.people_uris = None
+
+    @classmethod
+    def many(cls, metadatas) -> List["Movie"]:
+        """Movies for many dicts, interning all their uris in one batch."""
+        metadatas = list(metadatas)
+        uris = list()
+        for metadata in metadatas:
+            uris.append(metadata["uri"])
+            uris.extend(metadata["directors"])
+            uris.extend(metadata["writers"])
+            uris.extend(metadata["actors"])
+        ids = symbols.intern_many(uris)
+        movies = list()
+        start = 0
+        for metadata in metadatas:
+            movie = cls.__new__(cls)
+            movie.uri_id = ids[start]
+            movie.title = metadata["title"]
+            start += 1
+            for slot, key in zip(("director_ids", "writer_ids", "actor_ids"), ROLE_KEYS):
+                end = start + len(metadata[key])
+                setattr(movie, slot, ids[start:end])
+                start = end
+            movie.people_uris = None
+            movies.append(movie)
+        return movies
+
+    def _people_uris(self) -> tuple:
+        if self.people_uris is None:
+            self.people_uris = tuple(tuple(symbols.uris_for(ids))
+                                     for ids in (self.director_ids, self.writer_ids, self.actor_ids))
+        return self.people_uris
+
+    @property
+    def uri(self) -> str:
+        return symbols.uri(self.uri_id)
+
+    @property
+    def directors(self) -> Tuple[str, ...]:
+        return self._people_uris()[0]
+
+    @property
+    def writers(self) -> Tuple[str, ...]:
+        return self._people_uris()[1]
+
+    @property
+    def actors(self) -> Tuple[str, ...]:
+        return self._people_uris()[2]
+
+    def to_dict(self) -> dict:
+        return {"uri": self.uri, "title": self.title, "directors": list(self.directors),
+                "writers": list(self.writers), "actors": list(self.actors)}
+
+
+# Roles in the order _people_ids returns them
+ROLES = ("Director", "Writer", "Actor")
+# The key of each role's people in a movie dict, in the same order
+ROLE_KEYS = ("directors", "writers", "actors")
+
+
+# A person is normally in just one movie of a unique list, so a role index
+# holds that movie's id directly and only switches to a set of ids for the
+# rare person in several, which saves a set per person.
+def _index_films(index: dict, person: int):
+    """The ids of the movies person is in, per index."""
+    films = index.get(person, ())
+    return (films,) if isinstance(films, int) else films
+
+
+def _index_add(index: dict, person: int, film: int) -> None:
+    films = index.get(person)
+    if films is None:
+        index[person] = film
+    elif isinstance(films, int):
+        if films != film:
+            index[person] = {films, film}
+    else:
+        films.add(film)
+
+
+def _index_remove(index: dict, person: int, film: int) -> None:
+    films = index.get(person)
+    if films == film:
+        del index[person]
+    elif isinstance(films, set):
+        films.discard(film)
+        if len(films) == 1:
+            index[person] = films.pop()
+
+
+def _people_ids(movie) -> tuple:
+    """(director ids, writer ids, actor ids) of a Movie or a movie dict.
+
+    A dict's people are looked up without interning them: someone who was
+    never interned can't be in any list yet.
+    """
+    if isinstance(movie, Movie):
+        return movie.director_ids, movie.writer_ids, movie.actor_ids
+    return tuple([symbol for symbol in map(symbols.get, movie[role]) if symbol is not None]
+                 for role in ROLE_KEYS)
+
+class MovieListComplete(list_journal.JournaledList):
     """List of movies with an eye for completeness across given contributors."""
 
     def __init__(self, list_title: str):
         self.list_title = list_title
+        self.cache_file = f"{MOVIE_LIST_CACHE_DIR}complete_{list_title}.json"
+        # Cast-frequency counts kept in step with the list, once a page attaches them; see cast_counts
+        self.cast_counts = None
+        # Snapshot plus journal, safe to share between sessions and processes; see list_journal
+        self._init_journal()
+        self._load()
+
+    def _clear(self):
         self.movies = dict()
-        self.not_movies = dict()
-        self.cast_covered = dict()
+        # Interned ids, as bitsets; see symbol_table
+        self.not_movies = SymbolSet()
+        self.cast_covered = SymbolSet()
         self.ratings = dict()
-        self.cache_file = f"{MOVIE_LIST_CACHE_DIR}complete_{list_title}.json"
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file) as IN:
-                package = json.load(IN)
-                self.movies = dict()
-                for movie in package["movies"]:
-                    self.add_movie(movie)
-                if "not_movies" in package:
-                    for movie in package["not_movies"]:
-                        self.ignore_movie(movie)
-                self.cast_covered = package["cast_covered"]
-                if "ratings" in package:
-                    self.ratings = package["ratings"]
+
+    def _load_snapshot(self, package):
+        # Build the dicts in one go rather than replaying add_movie and
+        # ignore_movie per entry; ignored movies win, as they did then
+        not_movies = set(package.get("not_movies", []))
+        self.not_movies = symbols.intern_set(not_movies)
+        self.movies = {movie_id: movie_id.rpartition("/")[2] for movie_id in package["movies"]
+                       if movie_id not in not_movies}
+        self.cast_covered = symbols.intern_set(package["cast_covered"])
+        if "ratings" in package:
+            self.ratings = package["ratings"]
+
+    def _snapshot(self):
+        package = dict()
+        # deduplicate the movies
+        package["movies"] = list(self.movies.keys())
+        package["cast_covered"] = dict.fromkeys(symbols.uris_for(self.cast_covered), True)
+        package["not_movies"] = symbols.uris_for(self.not_movies)
+        package["ratings"] = self.ratings
+        return package
+
+    def _apply(self, entry):
+        action, movie_id = entry[0], entry[1]
+        if action == "add":
+            self.add_movie(movie_id, entry[2])
+        elif action == "rate":
+            self.rate_movie(movie_id, entry[2])
+        elif action == "ignore":
+            self.ignore_movie(movie_id, entry[2])
+        elif action == "unignore":
+            self.dont_ignore_movie(movie_id)
+        elif action == "remove":
+            self.remove_movie(movie_id)
+        elif action == "ack":
+            self.acknowledge_cast_member(movie_id)
 
     def write(self):
-        with open (self.cache_file, 'w') as OUT:
-            package = dict()
-            # deduplicate the movies
-            package["movies"] = list(self.movies.keys())
-            package["cast_covered"] = self.cast_covered
-            package["not_movies"] = list(self.not_movies.keys())
-            package["ratings"] = self.ratings
-            OUT.write(json.dumps(package, indent=2))
+        super().write()
+        if self.cast_counts is not None:
+            # Catch up on what other writers changed, then persist
+            self.cast_counts.sync(self.movies)
+            self.cast_counts.save()
+
+    def _update_cast_counts(self, movie_id):
+        # Loading and replaying skip this; the next sync() diffs the whole list instead
+        if self.cast_counts is not None and not self.replaying:
+            self.cast_counts.update(movie_id, movie_id in self.movies)
 
     def add_movie(self, movie_id, movie_title = None):
         self.dont_ignore_movie(movie_id)
         if not movie_title:
             movie_title = movie_id.split("/")[-1]
         self.movies[movie_id] = movie_title
+        self._record("add", movie_id, movie_title)
+        self._update_cast_counts(movie_id)
 
     def rate_movie(self, movie_id, rating: int):
         if movie_id in self.movies:
             self.ratings[movie_id] = rating
+            self._record("rate", movie_id, rating)
 
     def ignore_movie(self, movie_id, movie_title = None):
         self.remove_movie(movie_id)
         if not movie_title:
             movie_title = movie_id.split("/")[-1]
-        self.not_movies[movie_id] = movie_title
+        self.not_movies.add(symbols.intern(movie_id))
+        self._record("ignore", movie_id, movie_title)
 
     def dont_ignore_movie(self, movie_id):
-        if movie_id in self.not_movies:
-            del self.not_movies[movie_id]
+        symbol = symbols.get(movie_id)
+        if symbol in self.not_movies:
+            self.not_movies.remove(symbol)
+            self._record("unignore", movie_id)
 
     def remove_movie(self, movie_id):
+        if movie_id in self.movies or movie_id in self.ratings:
+            self._record("remove", movie_id)
         if movie_id in self.movies:
             del self.movies[movie_id]
+            self._update_cast_counts(movie_id)
         if movie_id in self.ratings:
             del self.ratings[movie_id]
 
@@ -100,16 +250,17 @@ class MovieListComplete:
         return movie_id in self.movies
 
     def is_ignored(self, movie_id):
-        return movie_id in self.not_movies
+        return symbols.get(movie_id) in self.not_movies
 
     def get_movies(self):
         return self.movies
 
     def acknowledge_cast_member(self, cast_member_uri):
-        self.cast_covered[cast_member_uri] = True
+        self.cast_covered.add(symbols.intern(cast_member_uri))
+        self._record("ack", cast_member_uri)
 
     def is_cast_member_acknowledged(self, cast_member_uri):
-        return cast_member_uri in self.cast_covered
+        return symbols.get(cast_member_uri) in self.cast_covered
 
     def get_movie_rating(self, movie_id):
         return self.ratings.get(movie_id, -1)
@@ -117,26 +268,39 @@ class MovieListComplete:
     def get_unrated_movies(self):
         return [movie for movie in self.movies if movie not in self.ratings]
 
-class MovieList:
+class MovieList(list_journal.JournaledList):
     def __init__(self, list_title: str):
         self.list_title = list_title
+        self.cache_file = f"{MOVIE_LIST_CACHE_DIR}{list_title}.json"
+        # Snapshot plus journal, safe to share between sessions and processes; see list_journal
+        self._init_journal()
+        self._load()
+
+    def _clear(self):
+        # Keyed by interned ids; see symbol_table.  movies maps each movie to
+        # its Movie, which holds its people; the role indexes map each person
+        # to the movies they are in, so removing a movie only touches its own
+        # cast.  See _index_films for how those movies are stored.
         self.movies = dict()
         self.actor_index = dict()
         self.director_index = dict()
         self.writer_index = dict()
-        self.cache_file = f"{MOVIE_LIST_CACHE_DIR}{list_title}.json"
-        # Load from cache file if present
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file) as IN:
-                movie_structs = json.load(IN)
-                for movie_struct in movie_structs:
-                    self.add_movie_from_dict(movie_struct)
-            return
 
-    def write(self):
-        with open(self.cache_file, "w") as OUT:
-            movie_structs = [movie.__dict__ for movie in self.movies.values()]
-            OUT.write(json.dumps(movie_structs, indent=2))
+    def _load_snapshot(self, snapshot):
+        if isinstance(snapshot, list):
+            # Written before the journal, as a bare list of movies
+            snapshot = {"movies": snapshot}
+        for movie in Movie.many(snapshot["movies"]):
+            self.add_movie(movie)
+
+    def _snapshot(self):
+        return {"movies": [movie.to_dict() for movie in self.movies.values()]}
+
+    def _apply(self, entry):
+        if entry[0] == "add":
+            self.add_movie_from_dict(entry[1])
+        elif entry[0] == "remove" and self.has_movie_by_uri(entry[1]):
+            self.remove_movie_by_uri(entry[1])
 
     def add_movie_from_dict(self, movie_struct: dict, replace_if_needed: bool = False) -> bool:
         movie = Movie(movie_struct)
@@ -144,8 +308,11 @@ class MovieList:
 
     def add_movie(self, movie: Movie, replace_if_needed: bool = False) -> bool:
         if self.can_add(movie):
-            self.movies[movie.uri] = movie
+            self.movies[movie.uri_id] = movie
             self._update_indexes_for_add(movie)
+            if not self.replaying:
+                # Only built for the journal; loading would decode every cast for nothing
+                self._record("add", movie.to_dict())
             return True
         if replace_if_needed:
             # identify movies that need to be removed
@@ -161,87 +328,113 @@ class MovieList:
             return True
         return False
 
+    def _roles(self, movie) -> tuple:
+        """(role, person ids, index) for each role of a Movie or movie dict."""
+        return tuple(zip(ROLES, _people_ids(movie), self._role_indexes()))
+
+    def _role_indexes(self) -> tuple:
+        return self.director_index, self.writer_index, self.actor_index
+
     def _update_indexes_for_add(self, movie: Movie) -> None:
-        for director in movie.directors:
-            self.director_index[director] = movie.uri
-        for writer in movie.writers:
-            self.writer_index[writer] = movie.uri
-        for actor in movie.actors:
-            self.actor_index[actor] = movie.uri
+        for _, people, index in self._roles(movie):
+            for person in people:
+                _index_add(index, person, movie.uri_id)
 
     def _update_indexes_for_remove(self, movie: Movie) -> None:
-        for director in movie.directors:
-            if director in self.director_index:
-                del self.director_index[director]
-        for writer in movie.writers:
-            if writer in self.writer_index:
-                del self.writer_index[writer]
-        for actor in movie.actors:
-            if actor in self.actor_index:
-                del self.actor_index[actor]
+        for _, people, index in self._roles(movie):
+            for person in people:
+                _index_remove(index, person, movie.uri_id)
+
+    def _conflicts(self, movie) -> List[tuple]:
+        """(role, person id, film id) for each of movie's people already used in the list."""
+        conflicts = list()
+        for role, people, index in self._roles(movie):
+            for person in people:
+                for film in _index_films(index, person):
+                    conflicts.append((role, person, film))
+        return conflicts
 
     def can_add(self, movie: Movie) -> bool:
         return not self.cannot_add(movie)
 
     def cannot_add(self, movie: Movie) -> Union[str, bool]:
-        # Check if we have a dictionary of actors, directors, and writers
-        # If so, convert to a Movie and try again
-        if isinstance(movie, dict):
-            movie = Movie(movie)
-        for director in movie.directors:
-            if director in self.director_index:
-                return f"Director {director} already used in {self.director_index[director]}"
-        for writer in movie.writers:
-            if writer in self.writer_index:
-                return f"Writer {writer} already used in {self.writer_index[writer]}"
-        for actor in movie.actors:
-            if actor in self.actor_index:
-                return f"Actor {actor} already used in {self.actor_index[actor]}"
+        # Accepts a Movie or a dictionary of actors, directors, and writers
+        for role, people, index in self._roles(movie):
+            for person in people:
+                if person in index:
+                    film = min(_index_films(index, person))
+                    return f"{role} {symbols.uri(person)} already used in {symbols.uri(film)}"
         return False
 
     def cannot_add_complete(self, movie: Movie) -> List[tuple]:
-        # Check if we have a dictionary of actors, directors, and writers
-        # If so, convert to a Movie and try again
-        if isinstance(movie, dict):
-            movie = Movie(movie)
-        let_me_count_the_ways = list()
-        for director in movie.directors:
-            if director in self.director_index:
-                let_me_count_the_ways.append(("Director", director, self.director_index[director]))
-        for writer in movie.writers:
-            if writer in self.writer_index:
-                let_me_count_the_ways.append(("Writer", writer, self.writer_index[writer]))
-        for actor in movie.actors:
-            if actor in self.actor_index:
-                let_me_count_the_ways.append(("Actor", actor, self.actor_index[actor]))
-        return let_me_count_the_ways
+        # Accepts a Movie or a dictionary of actors, directors, and writers
+        # Back to uris for the caller
+        return [(role, symbols.uri(person), symbols.uri(film)) for role, person, film in self._conflicts(movie)]
+
+    def conflicts_for(self, movies) -> dict:
+        """Map each movie's uri to its cannot_add_complete() reasons, empty if it can be added.
+
+        Accepts Movies or movie dicts.
+        """
+        return {movie.uri if isinstance(movie, Movie) else movie["uri"]: self.cannot_add_complete(movie)
+                for movie in movies}
 
     def remove_movie(self, movie: Movie) -> None:
-        # Check if we have a dictionary of actors, directors, and writers
-        # If so, convert to a Movie and try again
-        if isinstance(movie, dict):
-            movie = Movie(movie)
-        del (self.movies[movie.uri])
-        self._update_indexes_for_remove(movie)
+        # Accepts a Movie or a dictionary; the list's own copy says whose entries to drop
+        self.remove_movie_by_uri(movie.uri if isinstance(movie, Movie) else movie["uri"])
 
     def remove_movie_by_uri(self, uri: str) -> None:
-        # find the movie in the list
-        del (self.movies[uri])
+        movie = self.movies.pop(symbols.get(uri))
+        self._update_indexes_for_remove(movie)
+        self._record("remove", uri)
+
+    def check_consistency(self) -> List[str]:
+        """Cross-check movies against the role indexes.  Returns a description of each problem found."""
+        problems = list()
+        for movie_id, movie in self.movies.items():
+            for role, people, index in self._roles(movie):
+                for person in people:
+                    if movie_id not in _index_films(index, person):
+                        problems.append(f"{role} {symbols.uri(person)} of {movie.uri} is missing from the index")
+        for position, (role, index) in enumerate(zip(ROLES, self._role_indexes())):
+            for person in index:
+                films = _index_films(index, person)
+                if len(films) != 1:
+                    problems.append(f"{role} {symbols.uri(person)} is used in {len(films)} movies")
+                for film in films:
+                    movie = self.movies.get(film)
+                    if movie is None:
+                        problems.append(f"{role} {symbols.uri(person)} points at {symbols.uri(film)}, not in the list")
+                    elif person not in _people_ids(movie)[position]:
+                        problems.append(f"{role} {symbols.uri(person)} is not in {movie.uri}")
+        return problems
+
+    def used_people(self):
+        """Yield (role position in ROLES, person id, movie id) for each person the list uses."""
+        for position, index in enumerate(self._role_indexes()):
+            for person in index:
+                for film in _index_films(index, person):
+                    yield position, person, film
 
     def get_movies(self) -> List[Movie]:
         return list(self.movies.values())
 
+    @staticmethod
+    def _uri_index(index: dict) -> dict:
+        return {symbols.uri(person): symbols.uri(min(_index_films(index, person))) for person in index}
+
+    # The used_* maps are person uri -> movie uri, built for display
     def get_used_actors(self) -> dict:
-        return self.actor_index
+        return self._uri_index(self.actor_index)
 
     def get_used_directors(self) -> dict:
-        return self.director_index
+        return self._uri_index(self.director_index)
 
     def get_used_writers(self) -> dict:
-        return self.writer_index
+        return self._uri_index(self.writer_index)
 
     def has_movie_by_uri(self, movie_uri):
-        return movie_uri in self.movies
+        return symbols.get(movie_uri) in self.movies
 
     def get_movie_uri_list(self):
-        return list(self.movies.keys())
+        return symbols.uris_for(self.movies)